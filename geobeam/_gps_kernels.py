@@ -0,0 +1,112 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Numba compiled kernels for coordinate conversions on large arrays.
+
+Numba is optional, if it is not installed NUMBA_AVAILABLE is False and
+callers should fall back to the NumPy implementations in gps_utils. Importing
+this module imports Numba, so gps_utils only does it for arrays large enough
+to pay for that and for compiling the kernels.
+"""
+
+import math
+
+try:
+  from numba import njit
+  from numba import prange
+  NUMBA_AVAILABLE = True
+except ImportError:
+  NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+
+  @njit(parallel=True, cache=True)
+  def geodetic_to_cartesian_kernel(latitudes, longitudes, altitudes,
+                                   earth_radius, eccentricity,
+                                   out_x, out_y, out_z):
+    """Convert lat/lng/alt arrays to ECEF, writing into preallocated arrays.
+
+    Args:
+      latitudes: float64 array in Decimal Degrees
+      longitudes: float64 array in Decimal Degrees
+      altitudes: float64 array in meters
+      earth_radius: float, WGS84 earth radius in meters
+      eccentricity: float, WGS84 eccentricity
+      out_x: float64 array to write the x coordinates to
+      out_y: float64 array to write the y coordinates to
+      out_z: float64 array to write the z coordinates to
+    """
+    eccentricity_sq = eccentricity*eccentricity
+    for i in prange(latitudes.size):
+      latitude_radians = math.radians(latitudes[i])
+      longitude_radians = math.radians(longitudes[i])
+      cos_latitude = math.cos(latitude_radians)
+      sin_latitude = math.sin(latitude_radians)
+      n_vector = earth_radius/math.sqrt(1.0-eccentricity_sq*sin_latitude*sin_latitude)
+      equatorial_distance = (n_vector + altitudes[i])*cos_latitude
+      out_x[i] = equatorial_distance*math.cos(longitude_radians)
+      out_y[i] = equatorial_distance*math.sin(longitude_radians)
+      out_z[i] = ((1.0-eccentricity_sq)*n_vector + altitudes[i])*sin_latitude
+
+  @njit(parallel=True, cache=True)
+  def interpolate_to_cartesian_kernel(latitudes, longitudes, altitudes,
+                                      segment_counts, segment_offsets,
+                                      earth_radius, eccentricity,
+                                      out_latitude, out_longitude, out_altitude,
+                                      out_x, out_y, out_z):
+    """Interpolate points along each segment and convert them to ECEF.
+
+    Interpolation and conversion happen in the same loop so the interpolated
+    coordinates are converted while still in registers instead of being
+    written out and read back by a second pass.
+
+    Args:
+      latitudes: float64 array of segment end points in Decimal Degrees
+      longitudes: float64 array of segment end points in Decimal Degrees
+      altitudes: float64 array of segment end points in meters
+      segment_counts: int64 array, number of points to create for each segment
+      segment_offsets: int64 array, output index of each segment's first point
+      earth_radius: float, WGS84 earth radius in meters
+      eccentricity: float, WGS84 eccentricity
+      out_latitude: float64 array to write the latitudes to
+      out_longitude: float64 array to write the longitudes to
+      out_altitude: float64 array to write the altitudes to
+      out_x: float64 array to write the x coordinates to
+      out_y: float64 array to write the y coordinates to
+      out_z: float64 array to write the z coordinates to
+    """
+    eccentricity_sq = eccentricity*eccentricity
+    for i in prange(segment_counts.size):
+      count = segment_counts[i]
+      base = segment_offsets[i]
+      latitude_delta = (latitudes[i+1]-latitudes[i]) / count
+      longitude_delta = (longitudes[i+1]-longitudes[i]) / count
+      altitude_delta = (altitudes[i+1]-altitudes[i]) / count
+      for j in range(count):
+        latitude = latitudes[i] + latitude_delta*j
+        longitude = longitudes[i] + longitude_delta*j
+        altitude = altitudes[i] + altitude_delta*j
+        latitude_radians = math.radians(latitude)
+        longitude_radians = math.radians(longitude)
+        cos_latitude = math.cos(latitude_radians)
+        sin_latitude = math.sin(latitude_radians)
+        n_vector = earth_radius/math.sqrt(1.0-eccentricity_sq*sin_latitude*sin_latitude)
+        out_latitude[base+j] = latitude
+        out_longitude[base+j] = longitude
+        out_altitude[base+j] = altitude
+        equatorial_distance = (n_vector + altitude)*cos_latitude
+        out_x[base+j] = equatorial_distance*math.cos(longitude_radians)
+        out_y[base+j] = equatorial_distance*math.sin(longitude_radians)
+        out_z[base+j] = ((1.0-eccentricity_sq)*n_vector + altitude)*sin_latitude
@@ -14,7 +14,7 @@
 
 """Generate route that can be made into User Motion File based on two locations.
 
-Classes for Location, Route, and TimedRoute. A Route is a list of points that
+Classes for Route and TimedRoute. A Route is a RouteArray of points that
 connect a user given start and end location. TimedRoute is a child class of
 Route and incorporates a user specified speed of travel and point frequency,
 which can be used to create a user motion file (10 Hz) with various simulated
@@ -26,21 +26,30 @@ speeds (walking, running, biking)
   user_motion.write_route("usermotiontestfile.csv")
 """
 
-import csv
+import numpy as np
 
-from geobeam.gps_utils import Location
+from geobeam.gps_utils import geodetic_to_cartesian_array
+from geobeam.gps_utils import interpolate_geodetic_to_cartesian
 from geobeam.map_requests import request_directions
 from geobeam.map_requests import request_elevations
+from geobeam.route_array import RouteArray
 
 FILE_FOLDER_PATH = "geobeam/user_motion_files/"
+_TIME_FORMAT = "%.1f"
+_XYZ_FORMAT = "%.6f"
+_WRITE_BUFFER_SIZE = 1 << 20
+# rows converted to Python floats at a time while writing a csv
+_WRITE_CHUNK_ROWS = 1 << 13
 
 class Route():
   """An object for a route based on the input of a start and ending location.
 
   Attributes:
-    start_location: a Location object for the start of the route
-    end_location: a Location object for the end of the route
-    route: a list of Location objects for each point on the route
+    start_location: a Location object for the start of the route, replaced
+    by the route's first RoutePoint once the route is created
+    end_location: a Location object for the end of the route, replaced
+    by the route's last RoutePoint once the route is created
+    route: a RouteArray with the coordinates of each point on the route
     distances: a list of distances between each pair of consecutive
     locations in meters
     polyline: an encoded format for the route given by the Maps API
@@ -50,7 +59,7 @@ class Route():
   def __init__(self, start_location, end_location):
     self.start_location = start_location
     self.end_location = end_location
-    self.route = []
+    self.route = RouteArray(0)
     self.distances = []
     self.polyline = None
     self.create_route()
@@ -58,20 +67,34 @@ class Route():
   def create_route(self):
     """Create a route by requesting from Maps API and then adding altitudes/xyz to each point.
 
-    sets attributes for the class based on API response and then calls
-    add_altitudes() to request elevation data for each point, and then add xyz
-    conversion to each point
+    sets attributes for the class based on API response and then builds the
+    route arrays with a single xyz conversion for all points
+    """
+    latitudes, longitudes, altitudes = self._request_route_points()
+    self._set_route(RouteArray.from_arrays(
+        latitudes, longitudes, altitudes,
+        *geodetic_to_cartesian_array(latitudes, longitudes, altitudes)))
+
+  def _request_route_points(self):
+    """Request the route's points and their altitudes from Maps API.
+
+    sets distances and polyline based on the API response and requests
+    elevation data for the points exactly as the API returned them
+
+    Returns:
+      latitudes, longitudes and altitudes of the route's points as arrays
     """
-    route = []
     locations, self.distances, self.polyline = request_directions(self.start_location.get_lat_lon_tuple(), self.end_location.get_lat_lon_tuple())
     elevations = request_elevations(locations)
-    for location, altitude in zip(locations, elevations):
-      latitude = location[0]
-      longitude = location[1]
-      route.append(Location(latitude, longitude, altitude))
+    # transposed copy so the latitude and longitude rows are contiguous
+    latitudes, longitudes = np.array(locations, dtype=np.float64).T.copy()
+    altitudes = np.asarray(elevations, dtype=np.float64)
+    return latitudes, longitudes, altitudes
+
+  def _set_route(self, route):
     self.route = route
-    self.start_location = route[0]
-    self.end_location = route[-1]
+    self.start_location = route.as_location(0)
+    self.end_location = route.as_location(-1)
 
   def write_route(self, file_name):
     """Write route into csv with each line as x,y,z.
@@ -79,20 +102,22 @@ class Route():
     Args:
       file_name: name of file to write route to
     """
-    write_array = [location.get_xyz_tuple() for location in self.route]
-    _write_to_csv(FILE_FOLDER_PATH+file_name, write_array)
+    _write_to_csv(FILE_FOLDER_PATH+file_name,
+                  (self.route.x, self.route.y, self.route.z), _XYZ_FORMAT)
 
 
 class TimedRoute(Route):
   """An object for a route that has a desired speed and point frequency.
 
   Attributes:
-    start_location: a Location object for the start of the route
-    end_location: a Location object for the end of the route
+    start_location: a Location object for the start of the route, replaced
+    by the route's first RoutePoint once the route is created
+    end_location: a Location object for the end of the route, replaced
+    by the route's last RoutePoint once the route is created
     speed: how fast the person moves through the route in meters/second
     frequency: how many points per second the timed route should have (Hz)
-    route: a list of Location objects for each point on the route
-    distances: a list of distances for each pair of consecutive locations
+    route: a RouteArray with the coordinates of each point on the route
+    distances: an array of distances for each pair of consecutive locations
     in meters
     polyline: an encoded format for the route given by the Maps API
     for ease of drawing
@@ -104,44 +129,47 @@ class TimedRoute(Route):
     Route.__init__(self, start_location, end_location)
 
   def create_route(self):
-    Route.create_route(self)
-    self.upsample_route()
+    """Create a route from Maps API and upsample it.
+
+    xyz coordinates are only computed for the upsampled points, the points
+    returned by the API are never converted on their own
+    """
+    self.upsample_route(*self._request_route_points())
 
-  def upsample_route(self):
+  def upsample_route(self, latitudes, longitudes, altitudes):
     """Upsample the TimedRoute to match the desired speed and frequency.
 
     for each consecutive set of points, the change in lat,lon,alt is divided
     by split amongst the number of new points that need to be created so
     that there is roughly an equal distance (1/points_per_meter) between
     each of the points in the upsampled route.
+
+    Args:
+      latitudes: array of latitudes of the route's points
+      longitudes: array of longitudes of the route's points
+      altitudes: array of altitudes of the route's points
     """
     points_per_meter = self.frequency/self.speed
-    new_route = []
 
     # TODO(ameles) check if we need to do this for better location fixing
-    # fill first 10 cycles with starting location
-    for i in range(10):
-      new_route.append(self.route[0])
-
-    for i in range(len(self.distances)):
-      distance = self.distances[i]
-      start_point = self.route[i]
-      end_point = self.route[i+1]
-      new_route.append(start_point)
-
-      points_needed = int(distance*points_per_meter)-1
-      if points_needed > 0:
-        latitude_delta = (end_point.latitude-start_point.latitude) / points_needed
-        longitude_delta = (end_point.longitude-start_point.longitude) / points_needed
-        altitude_delta = (end_point.altitude-start_point.altitude) / points_needed
-        for j in range(1, points_needed):
-          new_point = Location(start_point.latitude + latitude_delta*j,
-                               start_point.longitude + longitude_delta*j,
-                               start_point.altitude + altitude_delta*j)
-          new_route.append(new_point)
-    new_route.append(self.route[-1])
-    self.route = new_route
-    self.distances = [1/points_per_meter for x in range(len(new_route)-1)]
+    # fill first 10 cycles with starting location, these and the final end
+    # point are added as single point segments so that the whole route is
+    # built with one interpolation pass
+    latitudes = np.concatenate(([latitudes[0]]*10, latitudes, latitudes[-1:]))
+    longitudes = np.concatenate(([longitudes[0]]*10, longitudes, longitudes[-1:]))
+    altitudes = np.concatenate(([altitudes[0]]*10, altitudes, altitudes[-1:]))
+
+    # each segment keeps its start point plus points_needed-1 interpolated
+    # points, so a segment that needs no new points contributes one point
+    points_needed = (np.asarray(self.distances)*points_per_meter).astype(np.int64)-1
+    segment_counts = np.concatenate(([1]*10, np.maximum(points_needed, 1), [1]))
+
+    new_route = RouteArray.from_arrays(
+        *interpolate_geodetic_to_cartesian(latitudes, longitudes, altitudes,
+                                           segment_counts))
+    self._set_route(new_route)
+    # every upsampled pair is the same distance apart
+    self.distances = np.full(len(new_route)-1, 1.0/points_per_meter)
 
   def write_route(self, file_name):
     """write route into csv with each line as time,x,y,z.
@@ -151,14 +179,31 @@ class TimedRoute(Route):
     Args:
       file_name: name of file to write route to
     """
-    write_array = []
-    time = 0.0
-    for location in self.route:
-      write_array.append(("%.1f" % (time,),)+location.get_xyz_tuple())
-      time = time + (1/self.frequency)
-    _write_to_csv(FILE_FOLDER_PATH+file_name, write_array)
+    times = np.arange(len(self.route))/self.frequency
+    _write_to_csv(FILE_FOLDER_PATH+file_name,
+                  (times, self.route.x, self.route.y, self.route.z),
+                  [_TIME_FORMAT, _XYZ_FORMAT, _XYZ_FORMAT, _XYZ_FORMAT])
 
 
-def _write_to_csv(file_name, value_array):
-  with open(file_name, "w") as csv_file:
-    csv.writer(csv_file).writerows(value_array)
+def _write_to_csv(file_name, columns, fmt):
+  """Write equal length arrays into csv as columns.
+
+  Every row is formatted with one printf style template. Rows are converted
+  and written _WRITE_CHUNK_ROWS at a time through a buffered file, so only
+  one chunk of the columns exists as Python floats at once.
+
+  Args:
+    file_name: name of file to write to
+    columns: sequence of arrays, one for each column
+    fmt: printf style format for every column or a list with one per column
+  """
+  if isinstance(fmt, str):
+    fmt = [fmt]*len(columns)
+  row_format = ",".join(fmt) + "\n"
+  columns = [np.asarray(column) for column in columns]
+  row_count = len(columns[0])
+  with open(file_name, "w", buffering=_WRITE_BUFFER_SIZE) as csv_file:
+    for start in range(0, row_count, _WRITE_CHUNK_ROWS):
+      end = start + _WRITE_CHUNK_ROWS
+      rows = zip(*(column[start:end].tolist() for column in columns))
+      csv_file.writelines(row_format % row for row in rows)
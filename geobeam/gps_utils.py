@@ -17,9 +17,15 @@
 
 import math
 
+import numpy as np
+
 # World Geodetic System defined constants
 _WGS84_EARTH_RADIUS = 6378137.0
 _WGS84_ECCENTRICITY = 0.0818191908426
+_WGS84_ECCENTRICITY_SQ = _WGS84_ECCENTRICITY**2
+# smallest number of points converted with the Numba kernels, importing Numba
+# and compiling the kernels takes longer than NumPy needs for smaller arrays
+NUMBA_MIN_POINTS = 1 << 24
 
 
 class Location():
@@ -34,6 +40,8 @@ class Location():
     z: a float for the z coordinate of the location in ECEF format
   """
 
+  __slots__ = ("latitude", "longitude", "altitude", "x", "y", "z")
+
   def __init__(self, latitude, longitude, altitude=0):
     self.latitude = latitude
     self.longitude = longitude
@@ -68,7 +76,6 @@ def geodetic_to_cartesian(latitude, longitude, altitude):
   Returns:
     location in ECEF format (x,y,z)
   """
-  eccentricity_sq = _WGS84_ECCENTRICITY**2
   latitude_radians = math.radians(latitude)
   longitude_radians = math.radians(longitude)
 
@@ -76,13 +83,122 @@ def geodetic_to_cartesian(latitude, longitude, altitude):
   sin_latitude = math.sin(latitude_radians)
   cos_longitude = math.cos(longitude_radians)
   sin_longitude = math.sin(longitude_radians)
-  n_vector = _WGS84_EARTH_RADIUS/math.sqrt(1.0-(_WGS84_ECCENTRICITY*sin_latitude)**2)
+  n_vector = _WGS84_EARTH_RADIUS/math.sqrt(1.0-_WGS84_ECCENTRICITY_SQ*sin_latitude*sin_latitude)
+
+  equatorial_distance = (n_vector + altitude)*cos_latitude
+  x = equatorial_distance*cos_longitude
+  y = equatorial_distance*sin_longitude
+  z = ((1.0-_WGS84_ECCENTRICITY_SQ)*n_vector + altitude)*sin_latitude
+  return (x, y, z)
+
+def geodetic_to_cartesian_array(latitudes, longitudes, altitudes):
+  """Convert arrays of lat/lng/alt geodetic coordinates to ECEF cartesian coordinates.
+
+  Vectorized version of geodetic_to_cartesian that converts every point in a
+  single pass, using the compiled Numba kernel for arrays of at least
+  NUMBA_MIN_POINTS points when Numba is installed and NumPy operations
+  otherwise.
+
+  Args:
+    latitudes: array-like of floats in Decimal Degrees
+    longitudes: array-like of floats in Decimal Degrees
+    altitudes: array-like of floats in meters
 
-  x = (n_vector + altitude)*cos_latitude*cos_longitude
-  y = (n_vector + altitude)*cos_latitude*sin_longitude
-  z = ((1.0-eccentricity_sq)*n_vector + altitude)*sin_latitude
+  Returns:
+    a tuple of (x, y, z) NumPy float arrays in ECEF format
+  """
+  latitudes = np.ascontiguousarray(latitudes, dtype=np.float64)
+  longitudes = np.ascontiguousarray(longitudes, dtype=np.float64)
+  altitudes = np.ascontiguousarray(altitudes, dtype=np.float64)
+
+  kernels = _numba_kernels(latitudes.size)
+  if kernels:
+    x = np.empty_like(latitudes)
+    y = np.empty_like(latitudes)
+    z = np.empty_like(latitudes)
+    kernels.geodetic_to_cartesian_kernel(latitudes, longitudes, altitudes,
+                                         _WGS84_EARTH_RADIUS,
+                                         _WGS84_ECCENTRICITY, x, y, z)
+    return (x, y, z)
+
+  # same math as geodetic_to_cartesian, computed with in-place ufuncs that
+  # reuse buffers so only the three result arrays plus a few scratch arrays
+  # are allocated however long the route is
+  latitude_radians = np.radians(latitudes)
+  longitude_radians = np.radians(longitudes)
+
+  sin_latitude = np.sin(latitude_radians)
+  cos_latitude = np.cos(latitude_radians, out=latitude_radians)
+  n_vector = np.square(sin_latitude)
+  n_vector *= -_WGS84_ECCENTRICITY_SQ
+  n_vector += 1.0
+  np.sqrt(n_vector, out=n_vector)
+  np.divide(_WGS84_EARTH_RADIUS, n_vector, out=n_vector)
+
+  z = n_vector*(1.0-_WGS84_ECCENTRICITY_SQ)
+  z += altitudes
+  z *= sin_latitude
+  equatorial_distance = np.add(n_vector, altitudes, out=n_vector)
+  equatorial_distance *= cos_latitude
+  y = equatorial_distance*np.sin(longitude_radians, out=sin_latitude)
+  x = np.multiply(equatorial_distance, np.cos(longitude_radians, out=longitude_radians),
+                  out=equatorial_distance)
   return (x, y, z)
 
+def interpolate_geodetic_to_cartesian(latitudes, longitudes, altitudes, segment_counts):
+  """Linearly interpolate between consecutive coordinates and convert to ECEF.
+
+  Segment i, from point i to point i+1, is divided into segment_counts[i]
+  equal steps and contributes its start point and every intermediate point,
+  but not its end point.
+
+  Args:
+    latitudes: array-like of floats in Decimal Degrees
+    longitudes: array-like of floats in Decimal Degrees
+    altitudes: array-like of floats in meters
+    segment_counts: array-like of ints >= 1, one for each pair of
+    consecutive coordinates
+
+  Returns:
+    a tuple of (latitudes, longitudes, altitudes, x, y, z) NumPy float arrays
+    for the interpolated points
+  """
+  latitudes = np.ascontiguousarray(latitudes, dtype=np.float64)
+  longitudes = np.ascontiguousarray(longitudes, dtype=np.float64)
+  altitudes = np.ascontiguousarray(altitudes, dtype=np.float64)
+  segment_counts = np.ascontiguousarray(segment_counts, dtype=np.int64)
+  segment_offsets = np.cumsum(segment_counts)-segment_counts
+  point_count = int(segment_counts.sum())
+
+  kernels = _numba_kernels(point_count)
+  if kernels:
+    new_latitudes = np.empty(point_count)
+    new_longitudes = np.empty(point_count)
+    new_altitudes = np.empty(point_count)
+    x = np.empty(point_count)
+    y = np.empty(point_count)
+    z = np.empty(point_count)
+    kernels.interpolate_to_cartesian_kernel(latitudes, longitudes, altitudes,
+                                            segment_counts, segment_offsets,
+                                            _WGS84_EARTH_RADIUS,
+                                            _WGS84_ECCENTRICITY,
+                                            new_latitudes, new_longitudes,
+                                            new_altitudes, x, y, z)
+    return (new_latitudes, new_longitudes, new_altitudes, x, y, z)
+
+  steps = np.arange(point_count)-np.repeat(segment_offsets, segment_counts)
+
+  def interpolate(values):
+    deltas = np.diff(values)/segment_counts
+    return (np.repeat(values[:-1], segment_counts) +
+            np.repeat(deltas, segment_counts)*steps)
+
+  new_latitudes = interpolate(latitudes)
+  new_longitudes = interpolate(longitudes)
+  new_altitudes = interpolate(altitudes)
+  x, y, z = geodetic_to_cartesian_array(new_latitudes, new_longitudes, new_altitudes)
+  return (new_latitudes, new_longitudes, new_altitudes, x, y, z)
+
 def cartesian_to_geodetic(x, y, z):
   """Convert a ECEF cartesian coordinate to a lat/lng/alt geodetic coordinate.
 
@@ -102,22 +218,21 @@ def cartesian_to_geodetic(x, y, z):
     of (0.0, 0.0, -6378137.0) is returned
   """
   eps = 1E-3 # convergence criteria
-  eccentricity_sq = _WGS84_ECCENTRICITY**2
 
-  norm_vector = math.sqrt(x*x+y*y+z*z)
+  norm_vector = math.hypot(x, y, z)
   if (norm_vector < eps):
     # Invalid ECEF vector
     return (0.0, 0.0, -_WGS84_EARTH_RADIUS)
 
   rho_sq = x*x + y*y
-  dz = eccentricity_sq*z
+  dz = _WGS84_ECCENTRICITY_SQ*z
 
   while True:
     zdz = z + dz
     nh = math.sqrt(rho_sq + zdz*zdz)
     sin_lat = zdz / nh
-    n = _WGS84_EARTH_RADIUS / math.sqrt(1.0-eccentricity_sq*sin_lat*sin_lat)
-    dz_new = n*eccentricity_sq*sin_lat
+    n = _WGS84_EARTH_RADIUS / math.sqrt(1.0-_WGS84_ECCENTRICITY_SQ*sin_lat*sin_lat)
+    dz_new = n*_WGS84_ECCENTRICITY_SQ*sin_lat
 
     if (math.fabs(dz-dz_new) < eps):
       break
@@ -129,3 +244,21 @@ def cartesian_to_geodetic(x, y, z):
   altitude = nh - n
 
   return (latitude, longitude, altitude)
+
+def _numba_kernels(point_count):
+  """Gets the Numba kernels if they are worth using for point_count points.
+
+  The kernels, and with them Numba, are only imported the first time an
+  array of at least NUMBA_MIN_POINTS points is converted.
+
+  Args:
+    point_count: int, number of points to convert
+  Returns:
+    the _gps_kernels module, or None if NumPy should be used
+  """
+  if point_count < NUMBA_MIN_POINTS:
+    return None
+  from geobeam import _gps_kernels
+  if not _gps_kernels.NUMBA_AVAILABLE:
+    return None
+  return _gps_kernels
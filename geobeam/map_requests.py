@@ -15,15 +15,29 @@
 """Handles requests and parsing of Google Maps API calls.
 """
 
+import concurrent.futures
 import datetime
+import functools
 import pprint
 
 from geobeam.config import api_key
 import googlemaps
+import numpy as np
+import requests
+
+# the Elevation API accepts at most 512 locations per request
+ELEVATION_CHUNK_SIZE = 500
+MAX_ELEVATION_WORKERS = 8
+# number of elevation chunks kept so repeated routes are not re-requested
+ELEVATION_CACHE_SIZE = 256
 
 # TODO(ameles) wrap map requests in a class so api isn't hard coded in
 API_KEY = api_key
-GMAPS = googlemaps.Client(key=API_KEY)
+# one keep-alive connection per elevation worker so concurrent chunks reuse
+# connections instead of each doing its own TLS handshake
+_SESSION = requests.Session()
+_SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=MAX_ELEVATION_WORKERS))
+GMAPS = googlemaps.Client(key=API_KEY, requests_session=_SESSION)
 
 
 def request_directions(start_location, end_location):
@@ -84,15 +98,36 @@ def parse_directions_response(directions_response):
 def request_elevations(locations):
   """Request elevations for a list of (lat,lon) coordinates.
 
+  Locations are split into chunks of ELEVATION_CHUNK_SIZE that are requested
+  concurrently, and the results are joined back together in order. Routes
+  that fit in a single chunk are requested directly.
+
   Args:
     locations: list of (lat,lon)
   Returns:
-    a list of elevation responses in the deserialized Elevation API response
-    format in order of input locations
+    a float64 array of elevations (in meters) in order of input locations
   """
-  elevations_response = GMAPS.elevation(locations)
-  parsed_elevations_response = parse_elevations_response(elevations_response)
-  return parsed_elevations_response
+  if not len(locations):
+    return np.empty(0, dtype=np.float64)
+  if len(locations) <= ELEVATION_CHUNK_SIZE:
+    # a typical route fits in one request, which needs no worker threads,
+    # copied like the joined chunks so callers never share the cached array
+    return np.array(_request_elevations_chunk(locations), dtype=np.float64)
+  chunks = [locations[i:i+ELEVATION_CHUNK_SIZE]
+            for i in range(0, len(locations), ELEVATION_CHUNK_SIZE)]
+  with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_ELEVATION_WORKERS) as executor:
+    parsed_elevations_responses = list(executor.map(_request_elevations_chunk, chunks))
+  return np.concatenate(parsed_elevations_responses)
+
+
+def _request_elevations_chunk(locations):
+  return _request_cached_elevations(tuple(tuple(location) for location in locations))
+
+
+@functools.lru_cache(maxsize=ELEVATION_CACHE_SIZE)
+def _request_cached_elevations(locations):
+  elevations_response = GMAPS.elevation(list(locations))
+  return parse_elevations_response(elevations_response)
 
 
 def parse_elevations_response(elevations_response):
@@ -102,9 +137,11 @@ def parse_elevations_response(elevations_response):
     elevations_response: list of elevation responses in the deserialized
     Elevation API response format
   Returns:
-    a list of elevations (in meters) in the same order as given response
+    a float64 array of elevations (in meters) in the same order as given
+    response
   """
-  return [result["elevation"] for result in elevations_response]
+  return np.fromiter((result["elevation"] for result in elevations_response),
+                     dtype=np.float64, count=len(elevations_response))
 
 def print_reponse(response):
   pp = pprint.PrettyPrinter(depth=6)
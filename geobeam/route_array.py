@@ -0,0 +1,106 @@
+# Copyright 2020 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Array backed storage for the points of a route.
+
+A RouteArray keeps each coordinate of every point in its own NumPy array
+(structure of arrays) instead of one Location object per point, so whole
+routes can be converted, interpolated and written without Python level loops.
+"""
+
+import collections
+
+import numpy as np
+
+
+class RoutePoint(collections.namedtuple("RoutePoint", ["latitude", "longitude", "altitude",
+                                                       "x", "y", "z"])):
+  """A single point of a route, with the same accessors as a Location."""
+
+  __slots__ = ()
+
+  def get_lat_lon_tuple(self):
+    return (self.latitude, self.longitude)
+
+  def get_xyz_tuple(self):
+    return (self.x, self.y, self.z)
+
+
+class RouteArray():
+  """An object for the points of a route stored as parallel arrays.
+
+  Attributes:
+    latitude: a float64 array of latitudes in Decimal Degrees
+    longitude: a float64 array of longitudes in Decimal Degrees
+    altitude: a float64 array of altitudes in meters
+    x: a float64 array of x coordinates in ECEF format
+    y: a float64 array of y coordinates in ECEF format
+    z: a float64 array of z coordinates in ECEF format
+  """
+
+  def __init__(self, size):
+    """Allocate arrays for a route with the given number of points.
+
+    Args:
+      size: int, number of points on the route
+    """
+    self.latitude = np.empty(size)
+    self.longitude = np.empty(size)
+    self.altitude = np.empty(size)
+    self.x = np.empty(size)
+    self.y = np.empty(size)
+    self.z = np.empty(size)
+
+  @classmethod
+  def from_arrays(cls, latitude, longitude, altitude, x, y, z):
+    """Create a RouteArray that uses the given arrays without copying them.
+
+    Args:
+      latitude: float64 array of latitudes in Decimal Degrees
+      longitude: float64 array of longitudes in Decimal Degrees
+      altitude: float64 array of altitudes in meters
+      x: float64 array of x coordinates in ECEF format
+      y: float64 array of y coordinates in ECEF format
+      z: float64 array of z coordinates in ECEF format
+
+    Returns:
+      A RouteArray backed by the given arrays
+    """
+    route_array = cls(0)
+    route_array.latitude = latitude
+    route_array.longitude = longitude
+    route_array.altitude = altitude
+    route_array.x = x
+    route_array.y = y
+    route_array.z = z
+    return route_array
+
+  def as_location(self, index):
+    """Get a single point of the route.
+
+    Args:
+      index: int, index of the point on the route
+
+    Returns:
+      a RoutePoint namedtuple with the point's coordinates
+    """
+    return RoutePoint(float(self.latitude[index]), float(self.longitude[index]),
+                      float(self.altitude[index]), float(self.x[index]),
+                      float(self.y[index]), float(self.z[index]))
+
+  def __getitem__(self, index):
+    return self.as_location(index)
+
+  def __len__(self):
+    return len(self.latitude)
@@ -23,15 +23,37 @@
   simulation_set.run_simulations()
 """
 
+import concurrent.futures
 import csv
 import datetime
+import io
+import os
+import select
+import selectors
+import signal
 import subprocess
+import sys
 import time
 
+import numpy as np
+
 from tools import kbhit
 
-KEYBOARD = kbhit.KBHit()
+# created on first use so importing this module leaves the terminal alone
+KEYBOARD = None
 ONE_SEC = 1
+# how often to check for key presses when the subprocess can't be waited on
+KEY_POLL_INTERVAL = 0.1
+# commands in the order they win when several keys are pressed at once
+COMMAND_PRIORITY = "qQnNpP"
+# most bytes of pending key presses taken from stdin in one read
+KEY_READ_SIZE = 1024
+# simulation set action for each (lower case) command key
+_KEY_ACTIONS = {"q": "quit", "n": "next", "p": "previous"}
+LOG_DIRECTORY = "simulation_logs"
+LOG_BUFFER_SIZE = 1 << 16
+# bladeGPS quits when it reads "q" on stdin
+_QUIT_BYTES = b"q"
 
 
 class Simulation():
@@ -39,6 +61,11 @@ class Simulation():
 
   """
 
+  __slots__ = ("_run_duration", "_gain", "_process_args", "_process", "_pidfd",
+               "_start_time", "_end_time", "_start_monotonic", "_end_monotonic")
+  # header row of the simulation's log entry
+  _LOG_FIELDS = ("simulation_type", "run_duration", "gain", "start_time", "end_time")
+
   def __init__(self, run_duration=None, gain=None):
     """Initialize Simulation object
 
@@ -48,47 +75,140 @@ class Simulation():
     """
     self._run_duration = run_duration
     self._gain = gain
+    self._process_args = self._build_process_args()
     self._process = None
+    self._pidfd = None
     self._start_time = None
     self._end_time = None
+    self._start_monotonic = None
+    self._end_monotonic = None
+
+  def _build_process_args(self):
+    """Builds the bladeGPS command for this simulation.
+
+    Subclasses set their own attributes before calling Simulation.__init__,
+    so the command is built once per simulation.
+
+    Returns:
+      tuple of the command's arguments
+    """
+    return build_bladeGPS_command(run_duration=self._run_duration, gain=self._gain)
 
   def run_simulation(self):
     """Starts bladeGPS subprocess using given simulation process arguments.
+
+    Also opens a pidfd for the subprocess that is kept until the simulation
+    ends, for waiting on it together with key presses. The start is recorded
+    both as a UTC time for the log and on the monotonic clock for measuring
+    the run, which stays right if the system clock is adjusted meanwhile.
     """
     self._start_time = datetime.datetime.utcnow()
-    self._process = create_bladeGPS_process(run_duration=self._run_duration, gain=self._gain)
+    self._start_monotonic = time.monotonic()
+    self._process = create_bladeGPS_process(self._process_args)
+    self._pidfd = _open_pidfd(self._process)
     return
 
   def end_simulation(self):
     """Ends the bladeGPS subprocess.
 
     Checks if the process is still running, and then attempts to quit (via
-    keyboard signal), terminate, and then kill the subprocess in that order
+    keyboard signal), terminate, and then kill the subprocess in that order.
+    Calling it again once the simulation has ended does nothing more.
     """
     self._end_time = datetime.datetime.utcnow()
-    while self.is_running():
-      self._process.communicate(input="q".encode())
-      print("Quitting simulation...")
-      time.sleep(ONE_SEC)
-      if self._process.poll() is None:
-        print("Terminating subprocess...")
-        self._process.terminate()
-        time.sleep(ONE_SEC)
-      if self._process.poll() is None:
-        print("Killing subprocess...")
-        self._process.kill()
-        time.sleep(ONE_SEC)
+    self._end_monotonic = time.monotonic()
+    if self.is_running():
+      self._stop_process()
+    elif self._process is not None:
+      _close_stdin(self._process)
+    if self._pidfd is not None:
+      os.close(self._pidfd)
+      self._pidfd = None
     self._process = None
     print("Subprocess closed.")
     print("------------------------------------------------")
 
+  def _stop_process(self):
+    """Stops the running bladeGPS subprocess.
+
+    Each step waits up to a second for the process to exit and returns as
+    soon as it does. Terminate and kill are sent to the whole process group
+    so bladeGPS itself is stopped along with the script that started it.
+    Killing can't be ignored, so the last wait is unbounded to make sure the
+    process has been reaped. If an earlier attempt was interrupted after
+    sending the quit key, its stdin is closed and this goes on to terminate.
+    """
+    if not self._process.stdin.closed:
+      try:
+        self._process.stdin.write(_QUIT_BYTES)
+        self._process.stdin.flush()
+      except OSError:
+        # bladeGPS closed its end, terminating below still ends the process
+        pass
+      finally:
+        _close_stdin(self._process)
+    print("Quitting simulation...")
+    if _wait_for_exit(self._process, self._pidfd, ONE_SEC):
+      return
+    print("Terminating subprocess...")
+    _signal_process_group(self._process, signal.SIGTERM)
+    if _wait_for_exit(self._process, self._pidfd, ONE_SEC):
+      return
+    print("Killing subprocess...")
+    _signal_process_group(self._process, signal.SIGKILL)
+    _wait_for_exit(self._process, self._pidfd, None)
+
   def is_running(self):
     """Checks if there is bladeGPS subprocess currently running.
 
+    Peeks at the process's state with waitid and WNOWAIT, which leaves an
+    exited process unreaped, so Popen.poll is only needed to reap it once it
+    has exited. The process is looked up by its pidfd when it has one, so a
+    reused pid can never be mistaken for it.
+
     Returns:
       True if there is a running process, False otherwise
     """
-    return bool(self._process and self._process.poll() is None)
+    if not self._process:
+      return False
+    if self._pidfd is not None and hasattr(os, "P_PIDFD"):
+      id_type, process_id = os.P_PIDFD, self._pidfd
+    else:
+      id_type, process_id = os.P_PID, self._process.pid
+    try:
+      exited = os.waitid(id_type, process_id,
+                         os.WEXITED | os.WNOHANG | os.WNOWAIT)
+    except (AttributeError, OSError):
+      # no waitid (or no waitid on pidfds) here, or the process has already
+      # been reaped, Popen.poll below gives the answer either way
+      exited = True
+    if exited is None:
+      return True
+    return self._process.poll() is None
+
+  def wait_for_key_or_exit(self, key_selector):
+    """Blocks until a key is pressed or the bladeGPS subprocess exits.
+
+    Waits on stdin and the subprocess's pidfd together, so no time is spent
+    polling while the simulation runs undisturbed. Without a pidfd it
+    returns after KEY_POLL_INTERVAL seconds at most.
+
+    Args:
+      key_selector: selector with stdin registered from create_key_selector,
+      None where stdin can't be selected on
+    """
+    if not self.is_running():
+      return
+    if key_selector is None:
+      time.sleep(KEY_POLL_INTERVAL)
+    elif self._pidfd is None:
+      key_selector.select(KEY_POLL_INTERVAL)
+    else:
+      key_selector.register(self._pidfd, selectors.EVENT_READ)
+      try:
+        key_selector.select()
+      finally:
+        key_selector.unregister(self._pidfd)
 
   def log_run(self, log_file_object):
     """Log start time, end time, type of simulation, and points.
@@ -101,15 +221,27 @@ class Simulation():
     """
     start_time_string = self._start_time.isoformat()
     end_time_string = self._end_time.isoformat()
-    fields = ["simulation_type", "run_duration", "gain", "start_time", "end_time"]
     values = [self.__class__.__name__, self._run_duration, self._gain, start_time_string, end_time_string]
-    log_file_object.write("\n")
-    csvwriter = csv.writer(log_file_object, delimiter=",")
-    csvwriter.writerow(fields)
-    csvwriter.writerow(values)
+    self._write_log_entry(log_file_object, [self._LOG_FIELDS, values])
+
+  def _write_log_entry(self, log_file_object, rows, text=""):
+    """Writes a blank line, csv rows and then text to the log in one write.
+
+    Args:
+      log_file_object: open file object to write to
+      rows: list of rows to write as csv
+      text: string to write after the rows
+    """
+    log_buffer = io.StringIO()
+    log_buffer.write("\n")
+    csvwriter = csv.writer(log_buffer, delimiter=",")
+    for row in rows:
+      csvwriter.writerow(row)
+    log_buffer.write(text)
+    log_file_object.write(log_buffer.getvalue())
 
   def __repr__(self):
-    return "Simulation(run_duration=%s, gain=%s)" % (self._run_duration, self._gain)
+    return f"Simulation(run_duration={self._run_duration}, gain={self._gain})"
 
 
 class StaticSimulation(Simulation):
@@ -117,6 +249,10 @@ class StaticSimulation(Simulation):
 
   """
 
+  __slots__ = ("_latitude", "_longitude")
+  _LOG_FIELDS = ("simulation_type", "latitude", "longitude", "run_duration", "gain",
+                 "start_time", "end_time")
+
   def __init__(self, latitude, longitude, run_duration=None, gain=None):
     """Initialize Static Simulation.
 
@@ -126,19 +262,20 @@ class StaticSimulation(Simulation):
       latitude: float, static location latitude in decimal degrees
       longitude: float, static location longitude in decimal degrees
     """
-    Simulation.__init__(self, run_duration, gain)
     self._latitude = latitude
     self._longitude = longitude
+    Simulation.__init__(self, run_duration, gain)
 
-  def run_simulation(self):
-    """Starts bladeGPS subprocess using given simulation process arguments.
+  def _build_process_args(self):
+    """Builds the bladeGPS command for this static location.
+
+    Returns:
+      tuple of the command's arguments
     """
-    self._start_time = datetime.datetime.utcnow()
-    location = "%s,%s" % (self._latitude, self._longitude)
-    self._process = create_bladeGPS_process(run_duration=self._run_duration,
-                                            gain=self._gain,
-                                            location=location)
-    return
+    location = f"{self._latitude},{self._longitude}"
+    return build_bladeGPS_command(run_duration=self._run_duration,
+                                  gain=self._gain,
+                                  location=location)
 
   def log_run(self, log_file_object):
     """Log start time, end time, type of simulation, and points.
@@ -151,19 +288,13 @@ class StaticSimulation(Simulation):
     """
     start_time_string = self._start_time.isoformat()
     end_time_string = self._end_time.isoformat()
-    fields = ["simulation_type", "latitude", "longitude", "run_duration", "gain", "start_time", "end_time"]
     values = [self.__class__.__name__, self._latitude, self._longitude,
               self._run_duration, self._gain, start_time_string, end_time_string]
-    log_file_object.write("\n")
-    csvwriter = csv.writer(log_file_object, delimiter=",")
-    csvwriter.writerow(fields)
-    csvwriter.writerow(values)
+    self._write_log_entry(log_file_object, [self._LOG_FIELDS, values])
 
   def __repr__(self):
-    return "StaticSimulation(latitude=%s, longitude=%s, run_duration=%s, gain=%s)" % (self._latitude,
-                                                                                      self._longitude,
-                                                                                      self._run_duration,
-                                                                                      self._gain)
+    return (f"StaticSimulation(latitude={self._latitude}, longitude={self._longitude}, "
+            f"run_duration={self._run_duration}, gain={self._gain})")
 
 
 class DynamicSimulation(Simulation):
@@ -171,6 +302,11 @@ class DynamicSimulation(Simulation):
 
   """
 
+  __slots__ = ("_file_path", "_route_data", "_route_line_ends")
+  _LOG_FIELDS = ("simulation_type", "file_path", "run_duration", "gain", "start_time", "end_time")
+  # header row of the route lines copied into the log entry
+  _ROUTE_LOG_FIELDS = ("time_from_zero", "x", "y", "z")
+
   def __init__(self, file_path, run_duration=None, gain=None):
     """An object for a single GPS Simulation for a static location.
 
@@ -180,17 +316,20 @@ class DynamicSimulation(Simulation):
       file_path: absolute file path to user motion csv file for
       dynamic route simulation
     """
-    Simulation.__init__(self, run_duration, gain)
     self._file_path = file_path
+    self._route_data = None
+    self._route_line_ends = None
+    Simulation.__init__(self, run_duration, gain)
 
-  def run_simulation(self):
-    """Starts bladeGPS subprocess using simulation process arguments.
+  def _build_process_args(self):
+    """Builds the bladeGPS command for this dynamic route.
+
+    Returns:
+      tuple of the command's arguments
     """
-    self._start_time = datetime.datetime.utcnow()
-    self._process = create_bladeGPS_process(run_duration=self._run_duration,
-                                            gain=self._gain,
-                                            dynamic_file_path=self._file_path)
-    return
+    return build_bladeGPS_command(run_duration=self._run_duration,
+                                  gain=self._gain,
+                                  dynamic_file_path=self._file_path)
 
   def log_run(self, log_file_object):
     """Log start time, end time, type of simulation, and points.
@@ -204,28 +343,41 @@ class DynamicSimulation(Simulation):
     """
     start_time_string = self._start_time.isoformat()
     end_time_string = self._end_time.isoformat()
-    fields = ["simulation_type", "file_path", "run_duration", "gain", "start_time", "end_time"]
     values = [self.__class__.__name__, self._file_path, self._run_duration,
               self._gain, start_time_string, end_time_string]
-    log_file_object.write("\n")
-    csvwriter = csv.writer(log_file_object, delimiter=",")
-    csvwriter.writerow(fields)
-    csvwriter.writerow(values)
-
-    csvwriter.writerow(["time_from_zero", "x", "y", "z"])
-    total_time = (self._end_time-self._start_time).total_seconds()
-    route_file_path = self._file_path
-    with open(route_file_path, "r") as route_file:
-      lines_to_read = int(total_time*10)  # 10 points per second
-      for _ in range(lines_to_read):
-        try:
-          log_file_object.write(next(route_file))
-        except StopIteration:
-          # reached end of source file
-          break
+    total_time = self._end_monotonic - self._start_monotonic
+    lines_to_read = int(total_time*10)  # 10 points per second
+    route_lines = self._read_route_lines(lines_to_read) if lines_to_read > 0 else ""
+    self._write_log_entry(log_file_object, [self._LOG_FIELDS, values, self._ROUTE_LOG_FIELDS],
+                          route_lines)
+
+  def _read_route_lines(self, line_count):
+    """Reads the first lines of the user motion file in one slice.
+
+    The file and the offsets of its newlines are read once and kept, so
+    logging the same simulation again only has to slice them.
+
+    Args:
+      line_count: int, number of lines to read
+    Returns:
+      string with up to line_count lines of the file, the whole file if it
+      is shorter
+    """
+    if self._route_data is None:
+      with open(self._file_path, "rb") as route_file:
+        self._route_data = route_file.read()
+      self._route_line_ends = np.flatnonzero(
+          np.frombuffer(self._route_data, dtype=np.uint8) == ord("\n"))
+    if line_count <= len(self._route_line_ends):
+      end = self._route_line_ends[line_count-1] + 1
+    else:
+      # reached end of source file
+      end = len(self._route_data)
+    return self._route_data[:end].decode()
 
   def __repr__(self):
-    return "DynamicSimulation(file_path=%s, run_duration=%s, gain=%s)" % (self._file_path, self._run_duration, self._gain)
+    return (f"DynamicSimulation(file_path={self._file_path}, "
+            f"run_duration={self._run_duration}, gain={self._gain})")
 
 
 class SimulationSet():
@@ -233,19 +385,28 @@ class SimulationSet():
 
   """
 
+  __slots__ = ("_simulations", "_simulation_count", "_current_simulation_index",
+               "_log_file", "_log_filename", "_log_file_path", "_log_executor",
+               "_pending_log")
+
   def __init__(self, simulations):
     """An object for a set of GPS simulations (that can be dynamic or static).
 
     Set current_simulation_index to None and create unique log file name
-    based on time stamp.
+    and path based on time stamp.
 
     Args:
       simulations: list of simulation objects in order of desired execution
     """
     self._simulations = simulations
+    self._simulation_count = len(simulations)
     self._current_simulation_index = None
+    self._log_file = None
+    self._log_executor = None
+    self._pending_log = None
     now = datetime.datetime.utcnow()
     self._log_filename = now.strftime("GPSSIM-%Y-%m-%d_%H:%M:%S.csv")
+    self._log_file_path = os.path.join(LOG_DIRECTORY, self._log_filename)
 
   def run_simulations(self):
     """Starts simulations and navigates through according to user key press.
@@ -253,29 +414,59 @@ class SimulationSet():
     Starts the first simulation, and then continuously checks if the current
     simulation is running, and switches to the next or previous based on
     keyboard input. If user presses q or last simulation finishes, it ends
-    the simulation set
+    the simulation set. The log file (and its directory, if missing) is
+    opened once for the whole set and simulations are logged on a background
+    thread while the next one runs.
     """
     print("------------------------------------------------")
     print("Press 'n' to go to next sim, 'p' to go to previous sim, or 'q' to quit")
     print("------------------------------------------------")
 
-    self._switch_simulation(0)
-    while True:
+    key_selector = None
+    try:
+      os.makedirs(LOG_DIRECTORY, exist_ok=True)
+      # not inheritable, so it isn't passed on to bladeGPS
+      self._log_file = open(self._log_file_path, "a", buffering=LOG_BUFFER_SIZE)
+      self._log_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+      key_selector = create_key_selector()
+      self._switch_simulation(0)
+      while True:
+        current_simulation = self._get_current_simulation()
+        current_simulation.wait_for_key_or_exit(key_selector)
+        simulation_running = current_simulation.is_running()
+        key_hit = key_pressed()
+        action = _KEY_ACTIONS.get(key_hit.lower()) if key_hit else None
+        #  quit via "q" press or end of last simulation
+        if (action == "quit" or
+            (not simulation_running and self._current_simulation_index >= self._simulation_count-1)):
+          current_simulation.end_simulation()
+          self._log_current_simulation()
+          self._finish_logging()
+          break
+        #  go to next simulation if "n" press or current sim ended
+        elif action == "next" or not simulation_running:
+          self._switch_simulation(self._current_simulation_index+1)
+        # go to previous simulation if "p" press
+        elif action == "previous":
+          self._switch_simulation(self._current_simulation_index-1)
+    except BaseException:
+      # bladeGPS runs in its own session, so it doesn't get the terminal's
+      # Ctrl-C and has to be stopped here when the loop is interrupted
       current_simulation = self._get_current_simulation()
-      simulation_running = current_simulation.is_running()
-      key_hit = key_pressed()
-      #  quit via "q" press or end of last simulation
-      if (key_hit == "q" or key_hit == "Q" or
-          (not simulation_running and self._current_simulation_index >= len(self._simulations)-1)):
+      if current_simulation:
         current_simulation.end_simulation()
-        self._log_current_simulation()
-        break
-      #  go to next simulation if "n" press or current sim ended
-      elif key_hit == "n" or key_hit == "N" or not simulation_running:
-        self._switch_simulation(self._current_simulation_index+1)
-      # go to previous simulation if "p" press
-      elif key_hit == "p" or key_hit == "P":
-        self._switch_simulation(self._current_simulation_index-1)
+      raise
+    finally:
+      # only what was acquired before an error needs to be released
+      if key_selector is not None:
+        key_selector.close()
+      if self._log_executor is not None:
+        self._log_executor.shutdown()
+        self._log_executor = None
+      self._pending_log = None
+      if self._log_file is not None:
+        self._log_file.close()
+        self._log_file = None
     print("Simulation set ending...")
     self._current_simulation_index = None
 
@@ -293,20 +484,25 @@ class SimulationSet():
   def _switch_simulation(self, new_simulation_index):
     """Switch to another simulation from the current simulation.
 
-    Ends and logs current simulation, and then begins the new simulation
-    and updates current simulation attributes
+    Ends current simulation, begins the new simulation and updates current
+    simulation attributes, and then logs the ended simulation. Only one
+    bladeGPS process can use the board at a time, so logging is the part
+    of the switch that is moved out of the gap between the two broadcasts.
 
     Args:
       new_simulation_index: int for index desired simulation to be run
     """
-    if new_simulation_index < len(self._simulations) and new_simulation_index >= 0:
+    if 0 <= new_simulation_index < self._simulation_count:
+      # the previous log reads the simulation that may be restarted below
+      self._finish_logging()
       current_simulation = self._get_current_simulation()
       if (current_simulation):
         current_simulation.end_simulation()
-        self._log_current_simulation()
       new_simulation = self._simulations[new_simulation_index]
       new_simulation.run_simulation()
       self._current_simulation_index = new_simulation_index
+      if (current_simulation):
+        self._log_simulation(current_simulation)
     elif new_simulation_index < 0:
       print("\nAlready on first simulation")
     else:
@@ -320,10 +516,34 @@ class SimulationSet():
     If Dynamic, it copies the corresponding lines for that time frame from
     the user motion file used as input
     """
-    log_file_path = "simulation_logs/" + self._log_filename
-    with open(log_file_path, "a") as logfile:
-      current_simulation = self._get_current_simulation()
-      current_simulation.log_run(logfile)
+    self._log_simulation(self._get_current_simulation())
+
+  def _log_simulation(self, simulation):
+    """Log a simulation of the set to the set's log file.
+
+    While the set is running the log is written by the log executor, so the
+    caller doesn't wait on file I/O. _finish_logging waits for it. A log
+    that is still pending is waited for first, so none of their errors are
+    lost.
+
+    Args:
+      simulation: the simulation object to log
+    """
+    if self._log_executor is None:
+      simulation.log_run(self._log_file)
+    else:
+      self._finish_logging()
+      self._pending_log = self._log_executor.submit(simulation.log_run, self._log_file)
+
+  def _finish_logging(self):
+    """Waits for the last simulation log started by _log_simulation.
+
+    Raises any error that happened while writing it.
+    """
+    if self._pending_log is not None:
+      pending_log = self._pending_log
+      self._pending_log = None
+      pending_log.result()
 
 
 class SimulationSetBuilder():
@@ -363,16 +583,16 @@ class SimulationSetBuilder():
     return SimulationSet(self._simulations)
 
 
-def create_bladeGPS_process(run_duration=None, gain=None, location=None, dynamic_file_path=None):
-  """Opens and returns the specified bladeGPS process based on arguments.
+def build_bladeGPS_command(run_duration=None, gain=None, location=None, dynamic_file_path=None):
+  """Builds the bladeGPS command for the given arguments.
   Args:
     run_duration: int, time in seconds for how long simulation should run
     gain: float, signal gain for the broadcast by bladeRF board
-    location: string, "%s,%s" % (latitude, longitude)
+    location: string, "latitude,longitude" in decimal degrees
     dynamic_file_path: string, absolute file path to user motion csv file for
     dynamic route simulation
   Returns:
-    subprocess called with command built from function inputs
+    tuple of the command's arguments, Popen takes it as is
   """
   command = ["./run_bladerfGPS.sh", "-T", "now"]
   if run_duration:
@@ -387,18 +607,163 @@ def create_bladeGPS_process(run_duration=None, gain=None, location=None, dynamic
   elif dynamic_file_path:
     command.append("-u")
     command.append(dynamic_file_path)
-  process = subprocess.Popen(command, stdin=subprocess.PIPE, cwd="./bladeGPS")
-  return process
+  return tuple(command)
+
+
+def create_bladeGPS_process(command):
+  """Opens and returns a bladeGPS process.
+
+  The process starts a new session, so it leads its own process group that
+  also holds everything the run script starts. File descriptors opened by
+  Python are not inheritable, so there are none to close before the exec.
+
+  Args:
+    command: tuple of arguments built by build_bladeGPS_command
+  Returns:
+    subprocess called with the command
+  """
+  return subprocess.Popen(command, stdin=subprocess.PIPE, cwd="./bladeGPS",
+                          close_fds=False, start_new_session=True)
+
+
+def _signal_process_group(process, signal_number):
+  """Sends a signal to every process in a subprocess's process group.
+
+  Args:
+    process: subprocess.Popen object created by create_bladeGPS_process
+    signal_number: int, the signal to send
+  """
+  try:
+    os.killpg(process.pid, signal_number)
+  except ProcessLookupError:
+    # the whole group has already exited
+    pass
+
+
+def create_key_selector():
+  """Creates a selector that reports key presses on stdin.
+
+  Also sets up the keyboard, so the terminal is already unbuffered when the
+  first simulation starts. Until then a key press is only delivered once
+  Enter is pressed, and switching modes would throw it away.
+
+  Returns:
+    a selector with stdin registered, or None on Windows where select only
+    works on sockets
+  """
+  _get_keyboard()
+  if os.name == "nt":
+    return None
+  key_selector = selectors.DefaultSelector()
+  key_selector.register(sys.stdin, selectors.EVENT_READ)
+  return key_selector
+
+
+def _close_stdin(process):
+  """Closes the pipe to a subprocess's stdin.
+
+  Args:
+    process: subprocess.Popen object created by create_bladeGPS_process
+  """
+  try:
+    process.stdin.close()
+  except OSError:
+    # a quit key that couldn't be written is still buffered and can't be
+    # flushed either, the pipe is closed all the same
+    pass
+
+
+def _open_pidfd(process):
+  """Opens a pidfd that becomes readable when the subprocess exits.
+
+  Args:
+    process: subprocess.Popen object to open the pidfd for
+  Returns:
+    the pidfd, or None if pidfd_open is unavailable (Linux before 5.3, macOS
+    and Windows) or the process has already been reaped
+  """
+  try:
+    return os.pidfd_open(process.pid)
+  except (AttributeError, OSError):
+    return None
+
+
+def _wait_for_exit(process, pidfd, timeout):
+  """Waits until a subprocess exits or the timeout passes.
+
+  Blocks on the process's pidfd so the wait ends as soon as it exits, and
+  falls back to Popen.wait where there is no pidfd.
+
+  Args:
+    process: subprocess.Popen object to wait for
+    pidfd: the pidfd opened for the process by _open_pidfd, None if there
+    is none, it is left open
+    timeout: float, maximum number of seconds to wait, None to wait until
+    the process exits
+  Returns:
+    True if the process has exited, False if it is still running
+  """
+  if process.poll() is not None:
+    return True
+  if pidfd is None:
+    try:
+      process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+      return False
+    return True
+  select.select([pidfd], [], [], timeout)
+  return process.poll() is not None
 
 
 def key_pressed():
-  """Uses Kbhit library to check if user has pressed key.
+  """Checks if user has pressed keys.
+
+  Reads every pending character so a burst of key presses is consumed at
+  once, and picks the most important command among them: quit, then next,
+  then previous.
 
   Returns:
     a character (string) if a key has been pressed, None otherwise
   """
-  pressed_char = None
-  if KEYBOARD.kbhit():
-    pressed_char = KEYBOARD.getch()
-  return pressed_char
+  pressed_chars = _read_pending_keys()
+  for command in COMMAND_PRIORITY:
+    if command in pressed_chars:
+      return command
+  return pressed_chars[-1] if pressed_chars else None
+
+
+def _read_pending_keys():
+  """Reads all characters typed since the last call without blocking.
 
+  On POSIX the terminal is in unbuffered mode, so everything typed is
+  waiting on stdin and is taken with a single read once select reports it.
+  Windows has no select on stdin and uses Kbhit one character at a time.
+
+  Returns:
+    string of the pending characters, empty if there are none or stdin has
+    reached end of input
+  """
+  keyboard = _get_keyboard()
+  if os.name == "nt":
+    pressed_chars = []
+    while keyboard.kbhit():
+      pressed_chars.append(keyboard.getch())
+    return "".join(pressed_chars)
+  if not select.select([keyboard.fd], [], [], 0)[0]:
+    return ""
+  return os.read(keyboard.fd, KEY_READ_SIZE).decode(errors="replace")
+
+
+def _get_keyboard():
+  """Gets the KBHit object, creating it on the first call.
+
+  KBHit switches the terminal to unbuffered input when created and restores
+  it at exit, so this happens once per program rather than on every check.
+
+  Returns:
+    the module's KBHit object
+  """
+  global KEYBOARD
+  if KEYBOARD is None:
+    KEYBOARD = kbhit.KBHit()
+  return KEYBOARD
@@ -1,47 +1,71 @@
 import unittest
+from unittest.mock import DEFAULT
 from unittest.mock import mock_open
 from unittest.mock import patch
 
+import numpy as np
+
 import geobeam
 
+# opaque to the code under test, which only passes it through
+_POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
 
 class RouteTest(unittest.TestCase):
 
+  @classmethod
+  def setUpClass(cls):
+    cls.location1 = (26.10000, 86.10299)
+    cls.location2 = (26.105345, 86.10344)
+    cls.location3 = (26.23334, 86.23432)
+    cls.altitudes = [5.11, 4.3, 7.4]
+    cls.distances = [5, 10]
+    cls.polyline = _POLYLINE
+    cls.location_list = [cls.location1, cls.location2, cls.location3]
+    cls.test_points = [(cls.location1[0], cls.location1[1], cls.altitudes[0]),
+                       (cls.location2[0], cls.location2[1], cls.altitudes[1]),
+                       (cls.location3[0], cls.location3[1], cls.altitudes[2])]
+
   def setUp(self):
-    self.location1 = (26.10000, 86.10299)
-    self.location2 = (26.105345, 86.10344)
-    self.location3 = (26.23334, 86.23432)
-    self.altitudes = [5.11, 4.3, 7.4]
-    self.distances = [5, 10]
-    self.polyline = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
-
-  @patch('geobeam.generate_route.Location.get_xyz_tuple')
-  @patch('geobeam.generate_route.request_elevations')
-  @patch('geobeam.generate_route.request_directions')
-  def test_create_route(self, mock_directions_request, mock_elevations_request, mock_get_xyz_tuple):
+    patcher = patch.multiple('geobeam.generate_route',
+                             request_directions=DEFAULT, request_elevations=DEFAULT)
+    mocks = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.mock_directions_request = mocks['request_directions']
+    self.mock_directions_request.return_value = (self.location_list, self.distances, self.polyline)
+    self.mock_elevations_request = mocks['request_elevations']
+    self.mock_elevations_request.return_value = self.altitudes
+
+  def test_create_route(self):
     start_location = geobeam.gps_utils.Location(*self.location1)
     end_location = geobeam.gps_utils.Location(*self.location3)
-    test_points = [(self.location1[0], self.location1[1], self.altitudes[0]),
-                   (self.location2[0], self.location2[1], self.altitudes[1]),
-                   (self.location3[0], self.location3[1], self.altitudes[2])]
-    location_list = [self.location1, self.location2, self.location3]
-    mock_directions_request.return_value = (location_list, self.distances, self.polyline)
-    mock_elevations_request.return_value = self.altitudes
 
     route = geobeam.generate_route.Route(start_location, end_location)
 
-    mock_directions_request.assert_called_once_with(self.location1, self.location3)
-    mock_elevations_request.assert_called_once_with(location_list)
-    for point, test_point in zip(route.route, test_points):
+    self.mock_directions_request.assert_called_once_with(self.location1, self.location3)
+    self.mock_elevations_request.assert_called_once_with(self.location_list)
+    for point, test_point in zip(route.route, self.test_points):
       self.assertEqual((point.latitude, point.longitude, point.altitude), test_point)
     self.assertEqual(len(route.route), 3)
     self.assertEqual(route.distances, self.distances)
     self.assertEqual(route.polyline, self.polyline)
+    self.assertEqual(route.start_location, route.route.as_location(0))
+    self.assertEqual(route.end_location, route.route.as_location(-1))
+
+  def test_create_route_again(self):
+    start_location = geobeam.gps_utils.Location(*self.location1)
+    end_location = geobeam.gps_utils.Location(*self.location3)
+    route = geobeam.generate_route.Route(start_location, end_location)
+
+    route.create_route()
+
+    self.mock_directions_request.assert_called_with(self.location1, self.location3)
+    self.assertEqual(self.mock_directions_request.call_count, 2)
+    self.assertEqual(len(route.route), 3)
 
   @patch('geobeam.generate_route._write_to_csv')
-  @patch('geobeam.generate_route.Location.get_xyz_tuple')
   @patch('geobeam.generate_route.Route.create_route')
-  def test_write_route(self, mock_create_route, mock_get_xyz_tuple, mock_write_to_csv):
+  def test_write_route(self, mock_create_route, mock_write_to_csv):
     start_location = geobeam.gps_utils.Location(*self.location1)
     end_location = geobeam.gps_utils.Location(*self.location3)
     filename = "writeroutetest.csv"
@@ -49,79 +73,88 @@ class RouteTest(unittest.TestCase):
                 (-2694180.667, -4297222.330, 3854325.576),
                 (1694180.667, -3297222.330, 2854325.576)]
     test_route = geobeam.generate_route.Route(start_location, end_location)
-    mock_get_xyz_tuple.side_effect = test_xyz
-    test_route.route = [geobeam.gps_utils.Location(*self.location1),
-                        geobeam.gps_utils.Location(*self.location2),
-                        geobeam.gps_utils.Location(*self.location3)]
+    test_route.route = geobeam.route_array.RouteArray(3)
+    test_route.route.x[:], test_route.route.y[:], test_route.route.z[:] = zip(*test_xyz)
 
     test_route.write_route(filename)
 
-    mock_write_to_csv.assert_called_once_with("geobeam/user_motion_files/writeroutetest.csv", test_xyz)
+    mock_write_to_csv.assert_called_once()
+    file_name, columns, fmt = mock_write_to_csv.call_args[0]
+    self.assertEqual(file_name, "geobeam/user_motion_files/writeroutetest.csv")
+    self.assertEqual(list(zip(*columns)), test_xyz)
+    self.assertEqual(fmt, "%.6f")
 
 class TimedRouteTest(unittest.TestCase):
 
+  @classmethod
+  def setUpClass(cls):
+    cls.location1 = (26.10000, 86.10299)
+    cls.location2 = (26.105345, 86.10344)
+    cls.location3 = (26.23334, 86.23432)
+    cls.altitudes = [5.11, 4.3, 7.4]
+    cls.distances = [5, 10]
+    cls.polyline = _POLYLINE
+    cls.location_list = [cls.location1, cls.location2, cls.location3]
+
+    cls.test_points = [(cls.location1[0], cls.location1[1], cls.altitudes[0]),
+                       (cls.location2[0], cls.location2[1], cls.altitudes[1]),
+                       (cls.location3[0], cls.location3[1], cls.altitudes[2])]
+
+    cls.start_location = geobeam.gps_utils.Location(*cls.location1)
+    cls.end_location = geobeam.gps_utils.Location(*cls.location3)
+
   def setUp(self):
-    self.location1 = (26.10000, 86.10299)
-    self.location2 = (26.105345, 86.10344)
-    self.location3 = (26.23334, 86.23432)
-    self.altitudes = [5.11, 4.3, 7.4]
-    self.distances = [5, 10]
-    self.polyline = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
-    self.location_list = [self.location1, self.location2, self.location3]
-
-    self.test_points = [(self.location1[0], self.location1[1], self.altitudes[0]),
-                        (self.location2[0], self.location2[1], self.altitudes[1]),
-                        (self.location3[0], self.location3[1], self.altitudes[2])]
-
-    self.patcher = patch('geobeam.generate_route.Location.get_xyz_tuple')
-    self.mock_get_xyz_tuple = self.patcher.start()
-    self.start_location = geobeam.gps_utils.Location(*self.location1)
-    self.end_location = geobeam.gps_utils.Location(*self.location3)
-
-  def tearDown(self):
-    self.patcher.stop()
+    patcher = patch.multiple('geobeam.generate_route',
+                             request_directions=DEFAULT, request_elevations=DEFAULT)
+    mocks = patcher.start()
+    self.addCleanup(patcher.stop)
+    self.mock_directions_request = mocks['request_directions']
+    self.mock_directions_request.return_value = (self.location_list, self.distances, self.polyline)
+    self.mock_elevations_request = mocks['request_elevations']
+    self.mock_elevations_request.return_value = self.altitudes
 
   @patch('geobeam.generate_route.TimedRoute.upsample_route')
-  @patch('geobeam.generate_route.request_elevations')
-  @patch('geobeam.generate_route.request_directions')
-  def test_create_route_initializes_correctly(self, mock_directions_request, mock_elevations_request, mock_upsample_route):
+  def test_create_route_initializes_correctly(self, mock_upsample_route):
     speed = 7  # meters per second
     frequency = 10  # Hz
-    mock_directions_request.return_value = (self.location_list, self.distances, self.polyline)
-    mock_elevations_request.return_value = self.altitudes
 
     route = geobeam.generate_route.TimedRoute(self.start_location, self.end_location, speed, frequency)
 
-    mock_directions_request.assert_called_once_with(self.location1, self.location3)
-    mock_elevations_request.assert_called_once_with(self.location_list)
+    self.mock_directions_request.assert_called_once_with(self.location1, self.location3)
+    self.mock_elevations_request.assert_called_once_with(self.location_list)
     mock_upsample_route.assert_called_once()
-    self.assertEqual(len(route.route), 3)
-    for point, test_point in zip(route.route, self.test_points):
-      self.assertEqual((point.latitude, point.longitude, point.altitude), test_point)
+    self.assertEqual(list(zip(*mock_upsample_route.call_args[0])), self.test_points)
+    self.assertEqual(route.distances, self.distances)
+    self.assertEqual(route.polyline, self.polyline)
 
-  @patch('geobeam.generate_route.request_elevations')
-  @patch('geobeam.generate_route.request_directions')
-  def test_upsample_route_correct_point_amount(self, mock_directions_request, mock_elevations_request):
+  @patch('geobeam.generate_route.geodetic_to_cartesian_array')
+  def test_create_route_converts_only_upsampled_points(self, mock_geodetic_to_cartesian_array):
     speed = 10  # meters per second
     frequency = 10  # Hz
-    mock_directions_request.return_value = (self.location_list, self.distances, self.polyline)
-    mock_elevations_request.return_value = self.altitudes
-    test_point_count = sum([int(distance*frequency/speed)-1 for distance in self.distances]) + 11
-    test_upsampled_distances = [speed/frequency for x in range(test_point_count-1)]
+
+    route = geobeam.generate_route.TimedRoute(self.start_location, self.end_location, speed, frequency)
+
+    mock_geodetic_to_cartesian_array.assert_not_called()
+    self.assertEqual(route.start_location, route.route.as_location(0))
+    self.assertEqual(route.end_location, route.route.as_location(-1))
+    self.assertEqual(route.end_location[:3], self.test_points[-1])
+
+  def test_upsample_route_correct_point_amount(self):
+    speed = 10  # meters per second
+    frequency = 10  # Hz
+    segment_point_counts = np.asarray(self.distances)*frequency//speed - 1
+    test_point_count = int(segment_point_counts.sum()) + 11
+    test_upsampled_distances = np.full(test_point_count-1, speed/frequency)
 
     route = geobeam.generate_route.TimedRoute(self.start_location, self.end_location, speed, frequency)
 
     # number of new points and original start points plus extra ten cycles of first point and last end point
     self.assertEqual(len(route.route), test_point_count)
-    self.assertEqual(route.distances, test_upsampled_distances)
+    np.testing.assert_array_equal(route.distances, test_upsampled_distances)
 
-  @patch('geobeam.generate_route.request_elevations')
-  @patch('geobeam.generate_route.request_directions')
-  def test_upsample_route_no_downsample(self, mock_directions_request, mock_elevations_request):
+  def test_upsample_route_no_downsample(self):
     speed = 10  # meters per second
     frequency = 1  # Hz
-    mock_directions_request.return_value = (self.location_list, self.distances, self.polyline)
-    mock_elevations_request.return_value = self.altitudes
     test_point_count = 13  # 10 extra cycles of first point plus 3 original points
 
     route = geobeam.generate_route.TimedRoute(self.start_location, self.end_location, speed, frequency)
@@ -137,35 +170,67 @@ class TimedRouteTest(unittest.TestCase):
     test_xyz = [(-2849585.509, 4655993.331, 3287769.376),
                 (-2694180.667, -4297222.330, 3854325.576),
                 (1694180.667, -3297222.330, 2854325.576)]
-    self.mock_get_xyz_tuple.side_effect = test_xyz
-    expected_write_array = [('0.0', -2849585.509, 4655993.331, 3287769.376),
-                            ('0.1', -2694180.667, -4297222.330, 3854325.576),
-                            ('0.2', 1694180.667, -3297222.330, 2854325.576)]
+    expected_write_array = [(0.0, -2849585.509, 4655993.331, 3287769.376),
+                            (0.1, -2694180.667, -4297222.330, 3854325.576),
+                            (0.2, 1694180.667, -3297222.330, 2854325.576)]
     test_route = geobeam.generate_route.TimedRoute(self.start_location, self.end_location, speed, frequency)
-    test_route.route = [geobeam.gps_utils.Location(*self.location1),
-                        geobeam.gps_utils.Location(*self.location2),
-                        geobeam.gps_utils.Location(*self.location3)]
+    test_route.route = geobeam.route_array.RouteArray(3)
+    test_route.route.x[:], test_route.route.y[:], test_route.route.z[:] = zip(*test_xyz)
 
     test_route.write_route(filename)
 
-    mock_write_to_csv.assert_called_once_with("geobeam/user_motion_files/writeroutetest.csv", expected_write_array)
+    mock_write_to_csv.assert_called_once()
+    file_name, columns, fmt = mock_write_to_csv.call_args[0]
+    self.assertEqual(file_name, "geobeam/user_motion_files/writeroutetest.csv")
+    self.assertEqual(list(zip(*columns)), expected_write_array)
+    self.assertEqual(fmt, ["%.1f", "%.6f", "%.6f", "%.6f"])
 
 
 class CSVWriterTest(unittest.TestCase):
 
-  @patch('geobeam.generate_route.csv')
-  def test_write_to_csv(self, mock_csv):
+  def test_write_to_csv(self):
+    open_mock = mock_open()
+    columns = ([0.0, 0.1, 0.2],
+               [-2849585.509, -2694180.667, 1694180.667],
+               [4655993.331, -4297222.330, -3297222.330],
+               [3287769.376, 3854325.576, 2854325.576])
+    fmt = ["%.1f", "%.6f", "%.6f", "%.6f"]
+    expected_lines = ["0.0,-2849585.509000,4655993.331000,3287769.376000\n",
+                      "0.1,-2694180.667000,-4297222.330000,3854325.576000\n",
+                      "0.2,1694180.667000,-3297222.330000,2854325.576000\n"]
+
+    with patch("geobeam.generate_route.open", open_mock, create=True):
+      geobeam.generate_route._write_to_csv("geobeam/user_motion_files/test.csv", columns, fmt)
+
+    open_mock.assert_called_with("geobeam/user_motion_files/test.csv", "w", buffering=1 << 20)
+    open_mock().writelines.assert_called_once()
+    self.assertEqual(list(open_mock().writelines.call_args[0][0]), expected_lines)
+
+  def test_write_to_csv_single_format(self):
+    open_mock = mock_open()
+    columns = ([-2849585.5091234, -2694180.667], [4655993.331, -4297222.33],
+               [3287769.376, 3854325.576])
+    expected_lines = ["-2849585.509123,4655993.331000,3287769.376000\n",
+                      "-2694180.667000,-4297222.330000,3854325.576000\n"]
+
+    with patch("geobeam.generate_route.open", open_mock, create=True):
+      geobeam.generate_route._write_to_csv("geobeam/user_motion_files/test.csv", columns, "%.6f")
+
+    self.assertEqual(list(open_mock().writelines.call_args[0][0]), expected_lines)
+
+  @patch("geobeam.generate_route._WRITE_CHUNK_ROWS", 2)
+  def test_write_to_csv_in_chunks(self):
     open_mock = mock_open()
-    expected_write_array = [('0.0', -2849585.509, 4655993.331, 3287769.376),
-                            ('0.1', -2694180.667, -4297222.330, 3854325.576),
-                            ('0.2', 1694180.667, -3297222.330, 2854325.576)]
+    columns = (np.array([0.0, 0.1, 0.2]), np.array([1.5, 2.5, 3.5]))
+    expected_lines = ["0.0,1.5\n", "0.1,2.5\n", "0.2,3.5\n"]
 
     with patch("geobeam.generate_route.open", open_mock, create=True):
-      geobeam.generate_route._write_to_csv("geobeam/user_motion_files/test.csv", expected_write_array)
+      geobeam.generate_route._write_to_csv("geobeam/user_motion_files/test.csv", columns, ["%.1f", "%.1f"])
 
-    open_mock.assert_called_with("geobeam/user_motion_files/test.csv", "w")
-    mock_csv.writer.assert_called_once()
-    mock_csv.writer().writerows.assert_called_once_with(expected_write_array)
+    self.assertEqual(open_mock().writelines.call_count, 2)
+    written_lines = [line for writelines_call in open_mock().writelines.call_args_list
+                     for line in writelines_call[0][0]]
+    self.assertEqual(written_lines, expected_lines)
 
 if __name__ == '__main__':
   unittest.main()
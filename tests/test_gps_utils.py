@@ -45,6 +45,13 @@ class LocationTest(unittest.TestCase):
     self.assertEqual(location.longitude, lon)
     self.assertEqual(location.altitude, 0)
 
+  def test_location_has_no_instance_dict(self):
+    location = gps_utils.Location(*self.geodetic_one)
+
+    self.assertFalse(hasattr(location, "__dict__"))
+    with self.assertRaises(AttributeError):
+      location.speed = 10
+
 class CoordinateConversionTest(unittest.TestCase):
 
   def coordinate_assertions(self, geodetic_coordinate, ecef_coordinate):
@@ -81,6 +88,74 @@ class CoordinateConversionTest(unittest.TestCase):
 
     self.coordinate_assertions(geodetic_mountainview_negative_altitude, ecef_mountainview_negative_altitude)
 
+  @patch('geobeam.gps_utils.NUMBA_MIN_POINTS', 0)
+  def test_geodetic_to_cartesian_array(self):
+    geodetic_coordinates = [(37.4178134, -122.086011, 3.45),
+                            (37.4211366, -122.0936967, -10.0),
+                            (31.230441, 121.467685, 4.5)]
+    latitudes, longitudes, altitudes = zip(*geodetic_coordinates)
+
+    xs, ys, zs = gps_utils.geodetic_to_cartesian_array(latitudes, longitudes, altitudes)
+
+    self.assertEqual(len(xs), 3)
+    for geodetic_coordinate, x, y, z in zip(geodetic_coordinates, xs, ys, zs):
+      expected = gps_utils.geodetic_to_cartesian(*geodetic_coordinate)
+      self.assertAlmostEqual(x, expected[0], places=6)
+      self.assertAlmostEqual(y, expected[1], places=6)
+      self.assertAlmostEqual(z, expected[2], places=6)
+
+  @patch('geobeam.gps_utils.NUMBA_MIN_POINTS', 0)
+  @patch('geobeam._gps_kernels.NUMBA_AVAILABLE', False)
+  def test_geodetic_to_cartesian_array_without_numba(self):
+    latitudes = (37.4178134, 31.230441)
+    longitudes = (-122.086011, 121.467685)
+    altitudes = (3.45, 4.5)
+
+    xs, ys, zs = gps_utils.geodetic_to_cartesian_array(latitudes, longitudes, altitudes)
+
+    for latitude, longitude, altitude, x, y, z in zip(latitudes, longitudes, altitudes, xs, ys, zs):
+      expected = gps_utils.geodetic_to_cartesian(latitude, longitude, altitude)
+      self.assertAlmostEqual(x, expected[0], places=6)
+      self.assertAlmostEqual(y, expected[1], places=6)
+      self.assertAlmostEqual(z, expected[2], places=6)
+
+  def interpolation_assertions(self):
+    latitudes = (37.4178134, 37.4211366, 37.4216022)
+    longitudes = (-122.086011, -122.0936967, -122.0964737)
+    altitudes = (3.45, -10.0, 4.5)
+    segment_counts = (4, 1)
+
+    result = gps_utils.interpolate_geodetic_to_cartesian(latitudes, longitudes, altitudes,
+                                                         segment_counts)
+
+    expected_latitudes = [37.4178134 + (37.4211366-37.4178134)*j/4 for j in range(4)] + [37.4211366]
+    expected_longitudes = [-122.086011 + (-122.0936967+122.086011)*j/4 for j in range(4)] + [-122.0936967]
+    expected_altitudes = [3.45 + (-10.0-3.45)*j/4 for j in range(4)] + [-10.0]
+    for i in range(3):
+      self.assertEqual(len(result[i]), 5)
+    for j in range(5):
+      self.assertAlmostEqual(result[0][j], expected_latitudes[j], places=9)
+      self.assertAlmostEqual(result[1][j], expected_longitudes[j], places=9)
+      self.assertAlmostEqual(result[2][j], expected_altitudes[j], places=9)
+      expected_xyz = gps_utils.geodetic_to_cartesian(result[0][j], result[1][j], result[2][j])
+      self.assertAlmostEqual(result[3][j], expected_xyz[0], places=6)
+      self.assertAlmostEqual(result[4][j], expected_xyz[1], places=6)
+      self.assertAlmostEqual(result[5][j], expected_xyz[2], places=6)
+
+  @patch('geobeam.gps_utils.NUMBA_MIN_POINTS', 0)
+  def test_interpolate_geodetic_to_cartesian(self):
+    self.interpolation_assertions()
+
+  @patch('geobeam.gps_utils.NUMBA_MIN_POINTS', 0)
+  @patch('geobeam._gps_kernels.NUMBA_AVAILABLE', False)
+  def test_interpolate_geodetic_to_cartesian_without_numba(self):
+    self.interpolation_assertions()
+
+  @patch('geobeam._gps_kernels.interpolate_to_cartesian_kernel', create=True)
+  def test_interpolate_geodetic_to_cartesian_below_numba_threshold(self, mock_kernel):
+    self.interpolation_assertions()
+    mock_kernel.assert_not_called()
+
   def test_geodetic_to_cartesian_shanghai(self):
     geodetic_shanghai = (31.230441, 121.467685, 4.5)
     ecef_shanghai = (-2849585.509, 4655993.331, 3287769.376)
@@ -4,19 +4,22 @@ from unittest.mock import patch
 
 from geobeam import map_requests
 
+_POLYLINE = "idkcFp|chVSYW?Ai@kB@Y?ClAAjAQ?AV?BM@AH\\C`E@dFAvB?nFB@J|B@]zN_@`PAh@EzAwAL_AHqAHaEZuERgCRkAF@V[LW@q@BWESKKHGNOTWBwCBK?}ANUHGFEHOZMAATAz@EtBOjH"
+
 
 class MapRequestsTest(unittest.TestCase):
-  def setUp(self):
+  @classmethod
+  def setUpClass(cls):
     point_one = (37.4178134, -122.086011)
     point_two = (37.4179142, -122.0858751)
     point_three = (37.4211366, -122.0936967)
     point_four = (37.4216022, -122.0964737)
 
-    self.polyline = "idkcFp|chVSYW?Ai@kB@Y?ClAAjAQ?AV?BM@AH\\C`E@dFAvB?nFB@J|B@]zN_@`PAh@EzAwAL_AHqAHaEZuERgCRkAF@V[LW@q@BWESKKHGNOTWBwCBK?}ANUHGFEHOZMAATAz@EtBOjH"
-    self.points = [point_one, point_two, point_three, point_four]
-    self.distances = [16, 13, 266]
+    cls.polyline = _POLYLINE
+    cls.points = [point_one, point_two, point_three, point_four]
+    cls.distances = [16, 13, 266]
 
-    self.sample_directions_response = [
+    cls.sample_directions_response = [
       {
         'bounds': {}, 
         'copyrights': 'Map data ©2020', 
@@ -27,19 +30,19 @@ class MapRequestsTest(unittest.TestCase):
           'start_location': {'lat': 37.4178134, 'lng': -122.086011},
           'steps': [
             {
-              'distance': {'text': '52 ft', 'value': self.distances[0]},
+              'distance': {'text': '52 ft', 'value': cls.distances[0]},
               'end_location': {'lat': point_two[0], 'lng': point_two[1]},
               'polyline': {'points': 'idkcFp|chVSY'}, 
               'start_location': {'lat': point_one[0], 'lng': point_one[1]}
             },
             {
-              'distance': {'text': '43 ft', 'value': self.distances[1]},
+              'distance': {'text': '43 ft', 'value': cls.distances[1]},
               'end_location': {'lat': point_three[0], 'lng': point_three[1]},
               'polyline': {'points': '}dkcFv{chVW?'},
               'start_location': {'lat': point_two[0], 'lng': point_two[1]}
             },
             {
-              'distance': {'text': '0.2 mi', 'value': self.distances[2]},
+              'distance': {'text': '0.2 mi', 'value': cls.distances[2]},
               'end_location': {'lat': point_four[0], 'lng': point_four[1]},
               'polyline': {'points': 'cykcFrlehVUHCDC@CDABCDKTMAAT?JAn@Cz@Ax@AVGpCCnAAp@'},
               'start_location': {'lat': point_three[0], 'lng': point_three[1]}
@@ -49,15 +52,15 @@ class MapRequestsTest(unittest.TestCase):
           'via_waypoint': []
           }
         ],
-        'overview_polyline': {'points': self.polyline},
+        'overview_polyline': {'points': cls.polyline},
         'summary': 'Rengstorff Ave'
       }
     ]
 
-    self.elevations = [3.45, 3.67, 3.78, 3.89]
-    self.sample_elevations_response = [
+    cls.elevations = [3.45, 3.67, 3.78, 3.89]
+    cls.sample_elevations_response = [
       {
-         "elevation" : self.elevations[0],
+         "elevation" : cls.elevations[0],
          "location" : {
             "lat" : point_one[0],
             "lng" : point_one[1]
@@ -65,7 +68,7 @@ class MapRequestsTest(unittest.TestCase):
          "resolution" : 4.771975994110107
       },
       {
-         "elevation" : self.elevations[1],
+         "elevation" : cls.elevations[1],
          "location" : {
             "lat" : point_two[0],
             "lng" : point_two[1]
@@ -73,7 +76,7 @@ class MapRequestsTest(unittest.TestCase):
          "resolution" : 4.771975994110107
       },
       {
-         "elevation" : self.elevations[2],
+         "elevation" : cls.elevations[2],
          "location" : {
             "lat" : point_three[0],
             "lng" : point_three[1]
@@ -81,7 +84,7 @@ class MapRequestsTest(unittest.TestCase):
          "resolution" : 4.771975994110107
       },
       {
-         "elevation" : self.elevations[3],
+         "elevation" : cls.elevations[3],
          "location" : {
             "lat" : point_four[0],
             "lng" : point_four[1]
@@ -91,6 +94,9 @@ class MapRequestsTest(unittest.TestCase):
 
     ]
 
+  def setUp(self):
+    map_requests._request_cached_elevations.cache_clear()
+
   @patch('geobeam.map_requests.datetime')
   @patch('geobeam.map_requests.GMAPS.directions')
   @patch('geobeam.map_requests.parse_directions_response')
@@ -119,20 +125,59 @@ class MapRequestsTest(unittest.TestCase):
 
   @patch('geobeam.map_requests.GMAPS.elevation')
   @patch('geobeam.map_requests.parse_elevations_response')
-  def test_request_elevations(self, mock_parse_elevations_response, mock_gmaps_elevation):
+  @patch('geobeam.map_requests.concurrent.futures.ThreadPoolExecutor')
+  def test_request_elevations(self, mock_executor, mock_parse_elevations_response,
+                              mock_gmaps_elevation):
     mock_gmaps_elevation.return_value = self.sample_elevations_response
     mock_parse_elevations_response.return_value = self.elevations
 
     result = map_requests.request_elevations(self.points)
 
+    mock_executor.assert_not_called()
     mock_gmaps_elevation.assert_called_once_with(self.points)
     mock_parse_elevations_response.assert_called_once_with(self.sample_elevations_response)
-    self.assertEqual(result, self.elevations)
+    self.assertEqual(result.tolist(), self.elevations)
+
+  @patch('geobeam.map_requests.GMAPS.elevation')
+  @patch('geobeam.map_requests.parse_elevations_response')
+  def test_request_elevations_chunked(self, mock_parse_elevations_response, mock_gmaps_elevation):
+    points = [(37.4178134 + i*1e-6, -122.086011) for i in range(1001)]
+    mock_gmaps_elevation.side_effect = lambda chunk: [point[0] for point in chunk]
+    mock_parse_elevations_response.side_effect = lambda response: response
+
+    result = map_requests.request_elevations(points)
+
+    self.assertEqual(mock_gmaps_elevation.call_count, 3)
+    requested_chunks = sorted(elevation_call[0][0] for elevation_call in mock_gmaps_elevation.call_args_list)
+    self.assertEqual(requested_chunks, [points[:500], points[500:1000], points[1000:]])
+    self.assertEqual(result.tolist(), [point[0] for point in points])
+
+  @patch('geobeam.map_requests.GMAPS.elevation')
+  def test_request_elevations_empty(self, mock_gmaps_elevation):
+    result = map_requests.request_elevations([])
+
+    mock_gmaps_elevation.assert_not_called()
+    self.assertEqual(result.dtype, "float64")
+    self.assertEqual(result.tolist(), [])
+
+  @patch('geobeam.map_requests.GMAPS.elevation')
+  @patch('geobeam.map_requests.parse_elevations_response')
+  def test_request_elevations_cached(self, mock_parse_elevations_response, mock_gmaps_elevation):
+    mock_gmaps_elevation.return_value = self.sample_elevations_response
+    mock_parse_elevations_response.return_value = self.elevations
+
+    first_result = map_requests.request_elevations(self.points)
+    second_result = map_requests.request_elevations([list(point) for point in self.points])
+
+    mock_gmaps_elevation.assert_called_once_with(self.points)
+    self.assertEqual(first_result.tolist(), self.elevations)
+    self.assertEqual(second_result.tolist(), self.elevations)
 
   def test_parse_elevations_response(self):
     result = map_requests.parse_elevations_response(self.sample_elevations_response)
 
-    self.assertEqual(result, self.elevations)
+    self.assertEqual(result.dtype, "float64")
+    self.assertEqual(result.tolist(), self.elevations)
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from geobeam import route_array
+
+
+class RouteArrayTest(unittest.TestCase):
+
+  def setUp(self):
+    self.geodetic_one = (37.4178134, -122.086011, 3.45)
+    self.ecef_one = (-2694180.667, -4297222.330, 3854325.576)
+    self.geodetic_two = (31.230441, 121.467685, 4.50)
+    self.ecef_two = (-2849585.509, 4655993.331, 3287769.376)
+
+  def test_route_array_init(self):
+    test_route_array = route_array.RouteArray(3)
+
+    self.assertEqual(len(test_route_array), 3)
+    for values in (test_route_array.latitude, test_route_array.longitude,
+                   test_route_array.altitude, test_route_array.x,
+                   test_route_array.y, test_route_array.z):
+      self.assertEqual(values.shape, (3,))
+
+  def test_from_arrays(self):
+    arrays = [np.array(values) for values in zip(self.geodetic_one + self.ecef_one,
+                                                 self.geodetic_two + self.ecef_two)]
+
+    test_route_array = route_array.RouteArray.from_arrays(*arrays)
+
+    self.assertEqual(len(test_route_array), 2)
+    self.assertIs(test_route_array.latitude, arrays[0])
+    self.assertIs(test_route_array.z, arrays[5])
+
+  def test_as_location(self):
+    test_route_array = route_array.RouteArray(2)
+    test_route_array.latitude[:], test_route_array.longitude[:], test_route_array.altitude[:] = zip(
+        self.geodetic_one, self.geodetic_two)
+    test_route_array.x[:], test_route_array.y[:], test_route_array.z[:] = zip(self.ecef_one,
+                                                                              self.ecef_two)
+
+    first_point = test_route_array.as_location(0)
+    last_point = test_route_array[-1]
+
+    self.assertEqual(first_point, self.geodetic_one + self.ecef_one)
+    self.assertEqual(last_point, self.geodetic_two + self.ecef_two)
+    self.assertEqual((last_point.latitude, last_point.longitude, last_point.altitude),
+                     self.geodetic_two)
+    self.assertEqual((last_point.x, last_point.y, last_point.z), self.ecef_two)
+    self.assertEqual(last_point.get_lat_lon_tuple(), self.geodetic_two[:2])
+    self.assertEqual(last_point.get_xyz_tuple(), self.ecef_two)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,8 +1,13 @@
+import concurrent.futures
 from datetime import datetime
+import os
+import selectors
+import signal
+import sys
 import unittest
 from unittest.mock import call
 from unittest.mock import create_autospec
-from unittest.mock import MagicMock
+from unittest.mock import Mock
 from unittest.mock import mock_open
 from unittest.mock import patch
 
@@ -11,6 +16,8 @@ from geobeam.simulations import DynamicSimulation
 from geobeam.simulations import Simulation
 from geobeam.simulations import StaticSimulation
 
+# the only attribute the simulations use on the log file
+_LOG_FILE_SPEC = ["write"]
 
 
 class SimulationSetRunTests(unittest.TestCase):
@@ -27,22 +34,28 @@ class SimulationSetRunTests(unittest.TestCase):
     self.simulation_set._current_simulation_index = index
     return
 
-  @patch('geobeam.simulations.datetime.datetime')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
   def test_simulation_set_init(self, mock_datetime):
     mock_datetime.utcnow.return_value = self.mock_now
 
     self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
 
     self.assertEqual(self.simulation_set._log_filename, "GPSSIM-2020-08-15_05:00:00.csv")
-
-  @patch('geobeam.simulations.SimulationSet._get_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._switch_simulation')
-  @patch('geobeam.simulations.key_pressed')
-  @patch('geobeam.simulations.datetime.datetime')
+    self.assertEqual(self.simulation_set._log_file_path,
+                     "simulation_logs/GPSSIM-2020-08-15_05:00:00.csv")
+
+  @patch.object(geobeam.simulations.os, 'makedirs')
+  @patch.object(geobeam.simulations, 'create_key_selector')
+  @patch.object(geobeam.simulations, 'open', new_callable=mock_open, create=True)
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_log_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_switch_simulation')
+  @patch.object(geobeam.simulations, 'key_pressed')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
   @patch('builtins.print')
   def test_run_simulations(self, mock_print, mock_datetime, mock_key_pressed, 
-                           mock_switch_simulation, mock_log_current_simulation, mock_get_current_simulation):
+                           mock_switch_simulation, mock_log_current_simulation, mock_get_current_simulation,
+                           mock_open_log, mock_create_key_selector, mock_makedirs):
     mock_datetime.utcnow.return_value = self.mock_now
     # 1 running, 2 running, 1 ends, 2 ends, 3 ends
     mock_key_pressed.side_effect = ["n", "p", None, None, None]
@@ -67,19 +80,31 @@ class SimulationSetRunTests(unittest.TestCase):
     self.assertEqual(self.simulations[0].is_running.call_count, 2)
     self.assertEqual(self.simulations[1].is_running.call_count, 2)
     self.assertEqual(self.simulations[2].is_running.call_count, 1)
-
-  @patch('geobeam.simulations.SimulationSet._get_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._switch_simulation')
-  @patch('geobeam.simulations.key_pressed')
-  @patch('geobeam.simulations.datetime.datetime')
+    self.simulations[0].wait_for_key_or_exit.assert_called_with(mock_create_key_selector.return_value)
+    self.assertEqual(self.simulations[0].wait_for_key_or_exit.call_count, 2)
+    mock_create_key_selector.return_value.close.assert_called_once()
+    mock_makedirs.assert_called_once_with("simulation_logs", exist_ok=True)
+    mock_open_log.assert_called_once_with("simulation_logs/GPSSIM-2020-08-15_05:00:00.csv", "a",
+                                          buffering=1 << 16)
+    mock_open_log().close.assert_called_once()
+    self.assertIsNone(self.simulation_set._log_file)
+
+  @patch.object(geobeam.simulations.os, 'makedirs')
+  @patch.object(geobeam.simulations, 'create_key_selector')
+  @patch.object(geobeam.simulations, 'open', new_callable=mock_open, create=True)
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_log_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_switch_simulation')
+  @patch.object(geobeam.simulations, 'key_pressed')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
   @patch('builtins.print')
   def test_run_simulations_quit_early(self, mock_print, mock_datetime, mock_key_pressed,
                                       mock_switch_simulation, mock_log_current_simulation,
-                                      mock_get_current_simulation):
+                                      mock_get_current_simulation, mock_open_log, mock_create_key_selector,
+                                      mock_makedirs):
     mock_datetime.utcnow.return_value = self.mock_now
     # 1 running, 1 ends, 2 running, quit
-    mock_key_pressed.side_effect = [None, None, None, "q"]
+    mock_key_pressed.side_effect = [None, "x", None, "Q"]
     mock_get_current_simulation.side_effect = [self.simulations[0],
                                                self.simulations[0],
                                                self.simulations[1],
@@ -99,6 +124,84 @@ class SimulationSetRunTests(unittest.TestCase):
     self.assertEqual(self.simulations[1].is_running.call_count, 2)
     self.assertEqual(self.simulations[2].is_running.call_count, 0)
 
+  @patch.object(geobeam.simulations.os, 'makedirs')
+  @patch.object(geobeam.simulations, 'create_key_selector')
+  @patch.object(geobeam.simulations, 'open', new_callable=mock_open, create=True)
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_switch_simulation')
+  @patch.object(geobeam.simulations, 'key_pressed')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
+  @patch('builtins.print')
+  def test_run_simulations_interrupted(self, mock_print, mock_datetime, mock_key_pressed,
+                                       mock_switch_simulation, mock_get_current_simulation,
+                                       mock_open_log, mock_create_key_selector, mock_makedirs):
+    mock_datetime.utcnow.return_value = self.mock_now
+    mock_key_pressed.side_effect = KeyboardInterrupt
+    mock_get_current_simulation.return_value = self.simulations[0]
+    self.simulations[0].is_running.return_value = True
+    mock_switch_simulation.side_effect = self.update_index
+    self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+
+    with self.assertRaises(KeyboardInterrupt):
+      self.simulation_set.run_simulations()
+
+    self.simulations[0].end_simulation.assert_called_once()
+    mock_open_log().close.assert_called_once()
+
+  @patch.object(geobeam.simulations, '_signal_process_group')
+  @patch.object(geobeam.simulations, '_wait_for_exit')
+  @patch.object(geobeam.simulations, 'create_bladeGPS_process')
+  @patch.object(geobeam.simulations, '_open_pidfd', return_value=None)
+  @patch.object(geobeam.simulations.Simulation, 'is_running', return_value=True)
+  @patch.object(geobeam.simulations.os, 'makedirs')
+  @patch.object(geobeam.simulations, 'create_key_selector')
+  @patch.object(geobeam.simulations, 'open', new_callable=mock_open, create=True)
+  @patch.object(geobeam.simulations, 'key_pressed', return_value="q")
+  @patch('builtins.print')
+  def test_run_simulations_interrupted_while_quitting(self, mock_print, mock_key_pressed,
+                                                      mock_open_log, mock_create_key_selector,
+                                                      mock_makedirs, mock_is_running,
+                                                      mock_open_pidfd, mock_create_bladeGPS_process,
+                                                      mock_wait_for_exit,
+                                                      mock_signal_process_group):
+    read_fd, write_fd = os.pipe()
+    self.addCleanup(os.close, read_fd)
+    mock_process = mock_create_bladeGPS_process.return_value
+    mock_process.stdin = open(write_fd, "wb")
+    # Ctrl-C while waiting for the quit key to take effect, then the second
+    # attempt has to terminate the process
+    mock_wait_for_exit.side_effect = [KeyboardInterrupt, False, True]
+    simulation = Simulation(run_duration=30)
+    self.simulation_set = geobeam.simulations.SimulationSet([simulation])
+
+    with self.assertRaises(KeyboardInterrupt):
+      self.simulation_set.run_simulations()
+
+    self.assertEqual(os.read(read_fd, 16), b"q")
+    mock_signal_process_group.assert_called_once_with(mock_process, signal.SIGTERM)
+    self.assertIsNone(simulation._process)
+    mock_open_log().close.assert_called_once()
+
+  @patch.object(geobeam.simulations.concurrent.futures, 'ThreadPoolExecutor')
+  @patch.object(geobeam.simulations.os, 'makedirs')
+  @patch.object(geobeam.simulations, 'create_key_selector')
+  @patch.object(geobeam.simulations, 'open', new_callable=mock_open, create=True)
+  @patch.object(geobeam.simulations.SimulationSet, '_switch_simulation')
+  @patch('builtins.print')
+  def test_run_simulations_setup_fails(self, mock_print, mock_switch_simulation, mock_open_log,
+                                       mock_create_key_selector, mock_makedirs, mock_executor):
+    mock_create_key_selector.side_effect = OSError
+    self.simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+
+    with self.assertRaises(OSError):
+      self.simulation_set.run_simulations()
+
+    mock_switch_simulation.assert_not_called()
+    mock_executor.return_value.shutdown.assert_called_once_with()
+    mock_open_log().close.assert_called_once()
+    self.assertIsNone(self.simulation_set._log_executor)
+    self.assertIsNone(self.simulation_set._log_file)
+
 class SimulationSetTest(unittest.TestCase):
 
   def setUp(self):
@@ -107,8 +210,7 @@ class SimulationSetTest(unittest.TestCase):
     simulation_three = create_autospec(DynamicSimulation)
     self.simulations = [simulation_one, simulation_two, simulation_three]
 
-  @patch('geobeam.simulations.datetime.datetime')
-  def test_get_current_simulation_not_running(self, mock_datetime):
+  def test_get_current_simulation_not_running(self):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     simulation_set._current_simulation_index = None
 
@@ -116,8 +218,7 @@ class SimulationSetTest(unittest.TestCase):
 
     self.assertIsNone(result)
 
-  @patch('geobeam.simulations.datetime.datetime')
-  def test_get_current_simulation(self, mock_datetime):
+  def test_get_current_simulation(self):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     simulation_set._current_simulation_index = 1
 
@@ -125,101 +226,208 @@ class SimulationSetTest(unittest.TestCase):
 
     self.assertEqual(result, self.simulations[1])
 
-  @patch('geobeam.simulations.SimulationSet._get_current_simulation')
-  @patch('geobeam.simulations.datetime.datetime')
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
   def test_log_current_simulation(self, mock_datetime, mock_get_current_simulation):
     mock_now = datetime(2020, 8, 15, 5, 0, 0)
     mock_datetime.utcnow.return_value = mock_now
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[1]
-    open_mock = mock_open()
+    simulation_set._log_file = Mock(spec_set=_LOG_FILE_SPEC)
+
+    simulation_set._log_current_simulation()
+
+    self.simulations[1].log_run.assert_called_once_with(simulation_set._log_file)
+
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  def test_log_simulation(self, mock_get_current_simulation):
+    simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    simulation_set._log_file = Mock(spec_set=_LOG_FILE_SPEC)
+
+    simulation_set._log_simulation(self.simulations[2])
+
+    self.simulations[2].log_run.assert_called_once_with(simulation_set._log_file)
+    mock_get_current_simulation.assert_not_called()
 
-    with patch("geobeam.simulations.open", open_mock, create=True):
-      open_mock.return_value = MagicMock()
-      simulation_set._log_current_simulation()
+  def test_log_simulation_in_background(self):
+    simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    simulation_set._log_file = Mock(spec_set=_LOG_FILE_SPEC)
+    simulation_set._log_executor = Mock(spec_set=concurrent.futures.Executor)
+
+    simulation_set._log_simulation(self.simulations[2])
 
-    self.simulations[1].log_run.assert_called_once()
-    open_mock.assert_called_with("simulation_logs/GPSSIM-2020-08-15_05:00:00.csv", "a")
+    simulation_set._log_executor.submit.assert_called_once_with(self.simulations[2].log_run,
+                                                               simulation_set._log_file)
+    self.simulations[2].log_run.assert_not_called()
+    self.assertEqual(simulation_set._pending_log, simulation_set._log_executor.submit.return_value)
 
-  @patch('geobeam.simulations.SimulationSet._get_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  @patch('geobeam.simulations.datetime.datetime')
-  def test_switch_simulation_from_start(self, mock_datetime, mock_log_current_simulation, mock_get_current_simulation):
+  def test_log_simulation_waits_for_pending_log(self):
+    simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    simulation_set._log_file = Mock(spec_set=_LOG_FILE_SPEC)
+    simulation_set._log_executor = Mock(spec_set=concurrent.futures.Executor)
+    pending_log = Mock(spec_set=concurrent.futures.Future)
+    pending_log.result.side_effect = OSError
+    simulation_set._pending_log = pending_log
+
+    with self.assertRaises(OSError):
+      simulation_set._log_simulation(self.simulations[2])
+
+    pending_log.result.assert_called_once_with()
+    simulation_set._log_executor.submit.assert_not_called()
+
+  def test_finish_logging(self):
+    simulation_set = geobeam.simulations.SimulationSet(self.simulations)
+    pending_log = Mock(spec_set=concurrent.futures.Future)
+    simulation_set._pending_log = pending_log
+
+    simulation_set._finish_logging()
+    simulation_set._finish_logging()
+
+    pending_log.result.assert_called_once_with()
+    self.assertIsNone(simulation_set._pending_log)
+
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_log_simulation')
+  def test_switch_simulation_from_start(self, mock_log_simulation, mock_get_current_simulation):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = None
     simulation_set._current_simulation_index = None
 
     simulation_set._switch_simulation(0)
 
-    mock_log_current_simulation.assert_not_called()
+    mock_log_simulation.assert_not_called()
     self.simulations[0].run_simulation.assert_called_once()
     self.assertEqual(simulation_set._current_simulation_index, 0)
 
-  @patch('geobeam.simulations.SimulationSet._get_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  @patch('geobeam.simulations.datetime.datetime')
-  def test_switch_simulation_next(self, mock_datetime, mock_log_current_simulation, mock_get_current_simulation):
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_log_simulation')
+  def test_switch_simulation_next(self, mock_log_simulation, mock_get_current_simulation):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[0]
     simulation_set._current_simulation_index = 0
 
+    # the ended simulation is only logged once the next one is running
+    mock_log_simulation.side_effect = (
+        lambda simulation: self.simulations[1].run_simulation.assert_called_once())
+    # and a log still being written is finished before anything is ended
+    pending_log = Mock(spec_set=concurrent.futures.Future)
+    pending_log.result.side_effect = self.simulations[0].end_simulation.assert_not_called
+    simulation_set._pending_log = pending_log
+
     simulation_set._switch_simulation(1)
 
-    mock_log_current_simulation.assert_called_once()
+    pending_log.result.assert_called_once_with()
+
+    mock_log_simulation.assert_called_once_with(self.simulations[0])
     self.simulations[0].end_simulation.assert_called_once()
     self.simulations[1].run_simulation.assert_called_once()
     self.assertEqual(simulation_set._current_simulation_index, 1)
 
-  @patch('geobeam.simulations.SimulationSet._get_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  @patch('geobeam.simulations.datetime.datetime')
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_log_simulation')
   @patch('builtins.print')
-  def test_switch_simulation_after_last(self, mock_print, mock_datetime, mock_log_current_simulation, mock_get_current_simulation):
+  def test_switch_simulation_after_last(self, mock_print, mock_log_simulation, mock_get_current_simulation):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[2]
     simulation_set._current_simulation_index = 2
 
     simulation_set._switch_simulation(3)
 
-    mock_log_current_simulation.assert_not_called()
+    mock_log_simulation.assert_not_called()
     self.simulations[2].end_simulation.assert_not_called()
     self.simulations[2].run_simulation.assert_not_called()
     self.assertEqual(simulation_set._current_simulation_index, 2)
     mock_print.assert_called_once_with("\nAlready on last simulation")
 
-  @patch('geobeam.simulations.SimulationSet._get_current_simulation')
-  @patch('geobeam.simulations.SimulationSet._log_current_simulation')
-  @patch('geobeam.simulations.datetime.datetime')
+  @patch.object(geobeam.simulations.SimulationSet, '_get_current_simulation')
+  @patch.object(geobeam.simulations.SimulationSet, '_log_simulation')
   @patch('builtins.print')
-  def test_switch_simulation_before_first(self, mock_print, mock_datetime, mock_log_current_simulation, mock_get_current_simulation):
+  def test_switch_simulation_before_first(self, mock_print, mock_log_simulation, mock_get_current_simulation):
     simulation_set = geobeam.simulations.SimulationSet(self.simulations)
     mock_get_current_simulation.return_value = self.simulations[0]
     simulation_set._current_simulation_index = 0
 
     simulation_set._switch_simulation(-1)
 
-    mock_log_current_simulation.assert_not_called()
+    mock_log_simulation.assert_not_called()
     self.simulations[0].end_simulation.assert_not_called()
     self.simulations[0].run_simulation.assert_not_called()
     self.assertEqual(simulation_set._current_simulation_index, 0)
     mock_print.assert_called_once_with("\nAlready on first simulation")
 
-  @patch('geobeam.simulations.KEYBOARD')
-  def test_key_pressed_not_pressed(self, mock_keyboard):
-    mock_keyboard.kbhit.return_value = False
-    mock_keyboard.getch.return_value = 'n'
+  @patch.object(geobeam.simulations.os, 'read')
+  @patch.object(geobeam.simulations.select, 'select')
+  @patch.object(geobeam.simulations, 'KEYBOARD')
+  def test_key_pressed_not_pressed(self, mock_keyboard, mock_select, mock_read):
+    mock_select.return_value = ([], [], [])
+
+    result = geobeam.simulations.key_pressed()
+
+    self.assertIsNone(result)
+    mock_select.assert_called_once_with([mock_keyboard.fd], [], [], 0)
+    mock_read.assert_not_called()
+
+  @patch.object(geobeam.simulations.os, 'read')
+  @patch.object(geobeam.simulations.select, 'select')
+  @patch.object(geobeam.simulations, 'KEYBOARD')
+  def test_key_pressed(self, mock_keyboard, mock_select, mock_read):
+    mock_select.return_value = ([mock_keyboard.fd], [], [])
+    mock_read.return_value = b'n'
+
+    result = geobeam.simulations.key_pressed()
+
+    self.assertEqual(result, 'n')
+    mock_read.assert_called_once_with(mock_keyboard.fd, geobeam.simulations.KEY_READ_SIZE)
+
+  @patch.object(geobeam.simulations.os, 'read')
+  @patch.object(geobeam.simulations.select, 'select')
+  @patch.object(geobeam.simulations, 'KEYBOARD')
+  def test_key_pressed_drains_pending_keys(self, mock_keyboard, mock_select, mock_read):
+    mock_select.return_value = ([mock_keyboard.fd], [], [])
+    mock_read.return_value = b'pxQn'
+
+    result = geobeam.simulations.key_pressed()
+
+    self.assertEqual(result, 'Q')
+    mock_read.assert_called_once()
+
+  @patch.object(geobeam.simulations.os, 'read')
+  @patch.object(geobeam.simulations.select, 'select')
+  @patch.object(geobeam.simulations, 'KEYBOARD')
+  def test_key_pressed_end_of_input(self, mock_keyboard, mock_select, mock_read):
+    mock_select.return_value = ([mock_keyboard.fd], [], [])
+    mock_read.return_value = b''
 
     result = geobeam.simulations.key_pressed()
 
     self.assertIsNone(result)
-    mock_keyboard.getch.assert_not_called()
 
-  @patch('geobeam.simulations.KEYBOARD')
-  def test_key_pressed(self, mock_keyboard):
-    mock_keyboard.kbhit.return_value = True
-    mock_keyboard.getch.return_value = 'n'
+  @patch.object(geobeam.simulations.os, 'name', 'nt')
+  @patch.object(geobeam.simulations, 'KEYBOARD')
+  def test_key_pressed_windows(self, mock_keyboard):
+    mock_keyboard.kbhit.side_effect = [True, True, False]
+    mock_keyboard.getch.side_effect = ['x', 'n']
 
     result = geobeam.simulations.key_pressed()
 
     self.assertEqual(result, 'n')
-    mock_keyboard.getch.assert_called_once()
+    self.assertEqual(mock_keyboard.getch.call_count, 2)
+
+  @patch.object(geobeam.simulations.kbhit, 'KBHit')
+  @patch.object(geobeam.simulations, 'KEYBOARD', None)
+  def test_get_keyboard_created_once(self, mock_kbhit):
+    first_keyboard = geobeam.simulations._get_keyboard()
+    second_keyboard = geobeam.simulations._get_keyboard()
+
+    mock_kbhit.assert_called_once_with()
+    self.assertIs(first_keyboard, mock_kbhit.return_value)
+    self.assertIs(second_keyboard, first_keyboard)
+
+  @patch.object(geobeam.simulations, '_get_keyboard')
+  @patch.object(geobeam.simulations.selectors, 'DefaultSelector')
+  def test_create_key_selector(self, mock_default_selector, mock_get_keyboard):
+    result = geobeam.simulations.create_key_selector()
+
+    mock_get_keyboard.assert_called_once_with()
+    self.assertEqual(result, mock_default_selector.return_value)
+    result.register.assert_called_once_with(sys.stdin, selectors.EVENT_READ)
@@ -1,147 +1,138 @@
+import contextlib
+import copy
 from datetime import datetime
+import io
+import os
+import selectors
+import signal
+import subprocess
+import tempfile
 import unittest
 from unittest.mock import call
-from unittest.mock import MagicMock
 from unittest.mock import Mock
-from unittest.mock import mock_open
 from unittest.mock import patch
 
 import geobeam
 
+# the only attributes the simulations use on these objects
+_LOG_FILE_SPEC = ["write"]
+_PROCESS_SPEC = ["pid", "poll", "stdin", "wait"]
+# build_bladeGPS_command arguments and the command they should build
+_BLADEGPS_COMMAND_CASES = (
+    ({}, ("./run_bladerfGPS.sh", "-T", "now")),
+    ({"run_duration": 20}, ("./run_bladerfGPS.sh", "-T", "now", "-d", "20")),
+    ({"gain": -2}, ("./run_bladerfGPS.sh", "-T", "now", "-a", "-2")),
+    ({"dynamic_file_path": "test/path"}, ("./run_bladerfGPS.sh", "-T", "now", "-u", "test/path")),
+    ({"run_duration": 20, "gain": -2},
+     ("./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2")),
+    ({"run_duration": 20, "gain": -2, "location": "27.12345,-37.45678"},
+     ("./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2", "-l", "27.12345,-37.45678")),
+    ({"run_duration": 20, "gain": -2, "dynamic_file_path": "test/path"},
+     ("./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2", "-u", "test/path")),
+    # a location wins over a user motion file
+    ({"run_duration": 20, "gain": -2, "location": "27.12345,-37.45678",
+      "dynamic_file_path": "test/path"},
+     ("./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2", "-l", "27.12345,-37.45678")),
+)
+
 
 class SimulationTest(unittest.TestCase):
 
-  def setUp(self):
-    self.run_duration = 100
-    self.gain = -2
-    self.start_time = datetime(2020, 8, 15, 5, 0, 0)
-    self.end_time = datetime(2020, 8, 15, 5, 1, 10)
-    self.latitude = 27.12345
-    self.longitude = -37.45678
-    self.location = "27.12345,-37.45678"
-    self.file_path = "/home/fakeuser/Desktop/geobeam/geobeam/user_motion_files/testfile.csv"
-
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.create_bladeGPS_process')
-  def test_run_simulation(self, mock_create_bladeGPS_process, mock_datetime):
+  @classmethod
+  def setUpClass(cls):
+    cls.run_duration = 100
+    cls.gain = -2
+    cls.start_time = datetime(2020, 8, 15, 5, 0, 0)
+    cls.end_time = datetime(2020, 8, 15, 5, 1, 10)
+    cls.latitude = 27.12345
+    cls.longitude = -37.45678
+    cls.location = "27.12345,-37.45678"
+    cls.file_path = "/home/fakeuser/Desktop/geobeam/geobeam/user_motion_files/testfile.csv"
+    # csv rows each simulation type's log_run should write
+    cls.log_rows = [
+        call(("simulation_type", "run_duration", "gain", "start_time", "end_time")),
+        call(["Simulation", cls.run_duration, cls.gain, "2020-08-15T05:00:00", "2020-08-15T05:01:10"])]
+    cls.static_log_rows = [
+        call(("simulation_type", "latitude", "longitude", "run_duration", "gain", "start_time",
+              "end_time")),
+        call(["StaticSimulation", cls.latitude, cls.longitude, cls.run_duration, cls.gain,
+              "2020-08-15T05:00:00", "2020-08-15T05:01:10"])]
+    # built once, tests work on shallow copies
+    cls.simulation_template = geobeam.simulations.Simulation(cls.run_duration, cls.gain)
+    cls.static_simulation_template = geobeam.simulations.StaticSimulation(cls.latitude,
+                                                                          cls.longitude,
+                                                                          cls.run_duration,
+                                                                          cls.gain)
+    cls.dynamic_simulation_template = geobeam.simulations.DynamicSimulation(cls.file_path,
+                                                                            cls.run_duration,
+                                                                            cls.gain)
+
+  @patch.object(geobeam.simulations.time, 'monotonic')
+  @patch.object(geobeam.simulations, '_open_pidfd')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
+  @patch.object(geobeam.simulations, 'create_bladeGPS_process')
+  def test_run_simulation(self, mock_create_bladeGPS_process, mock_datetime, mock_open_pidfd,
+                          mock_monotonic):
     mock_datetime.utcnow.return_value = self.start_time
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+    mock_monotonic.return_value = 1000.0
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation.run_simulation()
     self.assertEqual(test_simulation._start_time, self.start_time)
+    self.assertEqual(test_simulation._start_monotonic, 1000.0)
     mock_datetime.utcnow.assert_called_once()
-    mock_create_bladeGPS_process.assert_called_once_with(run_duration=self.run_duration, gain=self.gain)
-
-  @patch('geobeam.simulations.time')
-  @patch('builtins.print')
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_running_quit(self, mock_subprocess, mock_datetime,
-                                       mock_print, mock_time):
-    mock_datetime.utcnow.return_value = self.end_time
-    mock_subprocess.poll.side_effect = [0, 0]
-
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
-    test_simulation._process = mock_subprocess
-    test_simulation.is_running = Mock(side_effect=[True, False])
-    test_simulation.end_simulation()
-
-    self.assertIsNone(test_simulation._process)
-    self.assertEqual(test_simulation._end_time, self.end_time)
-
-    mock_subprocess.communicate.assert_called_once()
-    mock_subprocess.terminate.assert_not_called()
-    mock_subprocess.kill.assert_not_called()
-    self.assertEqual(mock_subprocess.poll.call_count, 2)
-
-    self.assertEqual(mock_time.sleep.call_count, 1)
-
-  @patch('geobeam.simulations.time')
-  @patch('builtins.print')
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_running_terminate(self, mock_subprocess, mock_datetime,
-                                            mock_print, mock_time):
-    mock_datetime.utcnow.return_value = self.end_time
-    mock_subprocess.poll.side_effect = [None, 0]
-
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
-    test_simulation._process = mock_subprocess
-    test_simulation.is_running = Mock(side_effect=[True, False])
-    test_simulation.end_simulation()
-
-    self.assertIsNone(test_simulation._process)
-    self.assertEqual(test_simulation._end_time, self.end_time)
-
-    mock_subprocess.communicate.assert_called_once()
-    mock_subprocess.terminate.assert_called_once()
-    mock_subprocess.kill.assert_not_called()
-    self.assertEqual(mock_subprocess.poll.call_count, 2)
-
-    self.assertEqual(mock_time.sleep.call_count, 2)
-
-  @patch('geobeam.simulations.time')
-  @patch('builtins.print')
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_running_terminate_and_kill(self, mock_subprocess, 
-                                                     mock_datetime, mock_print, mock_time):
-    mock_datetime.utcnow.return_value = self.end_time
-    mock_subprocess.poll.side_effect = [None, None]
-
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+    mock_create_bladeGPS_process.assert_called_once_with(("./run_bladerfGPS.sh", "-T", "now",
+                                                          "-d", "100", "-a", "-2"))
+    mock_open_pidfd.assert_called_once_with(mock_create_bladeGPS_process.return_value)
+    self.assertEqual(test_simulation._pidfd, mock_open_pidfd.return_value)
+
+  @patch.object(geobeam.simulations.os, 'waitid')
+  @patch.object(geobeam.simulations, 'subprocess')
+  def test_is_running_with_running_process(self, mock_subprocess, mock_waitid):
+    # current process is running
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation._process = mock_subprocess
-    test_simulation.is_running = Mock(side_effect=[True, False])
-    test_simulation.end_simulation()
-
-    self.assertIsNone(test_simulation._process)
-    self.assertEqual(test_simulation._end_time, self.end_time)
-
-    mock_subprocess.communicate.assert_called_once()
-    mock_subprocess.terminate.assert_called_once()
-    mock_subprocess.kill.assert_called_once()
-    self.assertEqual(mock_subprocess.poll.call_count, 2)
+    mock_subprocess.pid = 1234
+    mock_waitid.return_value = None
 
-    self.assertEqual(mock_time.sleep.call_count, 3)
+    result = test_simulation.is_running()
 
-  @patch('geobeam.simulations.time')
-  @patch('builtins.print')
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_end_simulation_done_running(self, mock_subprocess, mock_datetime, 
-                                       mock_print, mock_time):
-    mock_datetime.utcnow.return_value = self.end_time
+    self.assertTrue(result)
+    mock_waitid.assert_called_once_with(os.P_PID, 1234, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+    mock_subprocess.poll.assert_not_called()
 
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+  @patch.object(geobeam.simulations.os, 'waitid')
+  @patch.object(geobeam.simulations, 'subprocess')
+  def test_is_running_with_pidfd(self, mock_subprocess, mock_waitid):
+    # running process with a pidfd is looked up by the pidfd
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation._process = mock_subprocess
-    test_simulation.is_running = Mock(return_value=False)
-    test_simulation.end_simulation()
+    test_simulation._pidfd = 7
+    mock_waitid.return_value = None
 
-    self.assertIsNone(test_simulation._process)
-    self.assertEqual(test_simulation._end_time, self.end_time)
+    result = test_simulation.is_running()
 
-    mock_subprocess.communicate.assert_not_called()
-    mock_subprocess.terminate.assert_not_called()
-    mock_subprocess.kill.assert_not_called()
+    self.assertTrue(result)
+    mock_waitid.assert_called_once_with(os.P_PIDFD, 7, os.WEXITED | os.WNOHANG | os.WNOWAIT)
     mock_subprocess.poll.assert_not_called()
-    mock_time.sleep.assert_not_called()
 
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_is_running_with_running_process(self, mock_subprocess, mock_datetime):
-    # current process is running
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+  @patch.object(geobeam.simulations.os, 'waitid')
+  @patch.object(geobeam.simulations, 'subprocess')
+  def test_is_running_already_reaped(self, mock_subprocess, mock_waitid):
+    # process was reaped by an earlier poll, so waitid can't see it
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation._process = mock_subprocess
-    mock_subprocess.poll.return_value = None
+    mock_waitid.side_effect = ChildProcessError
+    mock_subprocess.poll.return_value = 0
 
     result = test_simulation.is_running()
 
-    self.assertTrue(result)
+    self.assertFalse(result)
+    mock_subprocess.poll.assert_called_once()
 
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_is_running_with_no_process(self, mock_subprocess, mock_datetime):
+  @patch.object(geobeam.simulations, 'subprocess')
+  def test_is_running_with_no_process(self, mock_subprocess):
     # no current process
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation._process = None
     mock_subprocess.poll.return_value = 0
 
@@ -149,11 +140,10 @@ class SimulationTest(unittest.TestCase):
 
     self.assertFalse(result)
 
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_is_running_process_and_poll_none(self, mock_subprocess, mock_datetime):
+  @patch.object(geobeam.simulations, 'subprocess')
+  def test_is_running_process_and_poll_none(self, mock_subprocess):
     # no current process
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation._process = None
     mock_subprocess.poll.return_value = None
 
@@ -161,142 +151,344 @@ class SimulationTest(unittest.TestCase):
 
     self.assertFalse(result)
 
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.subprocess')
-  def test_is_running_process_finished(self, mock_subprocess, mock_datetime):
+  @patch.object(geobeam.simulations.os, 'waitid')
+  @patch.object(geobeam.simulations, 'subprocess')
+  def test_is_running_process_finished(self, mock_subprocess, mock_waitid):
     # current process already finished
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation._process = mock_subprocess
+    mock_waitid.return_value = Mock()
     mock_subprocess.poll.return_value = 0
 
     result = test_simulation.is_running()
 
     self.assertFalse(result)
+    mock_subprocess.poll.assert_called_once()
+
+  @patch.object(geobeam.simulations.os, 'waitid')
+  def test_wait_for_key_or_exit(self, mock_waitid):
+    mock_waitid.return_value = None
+    mock_selector = Mock(spec_set=selectors.BaseSelector)
+    test_simulation = copy.copy(self.simulation_template)
+    test_simulation._process = Mock(spec_set=_PROCESS_SPEC)
+    test_simulation._pidfd = 7
+
+    test_simulation.wait_for_key_or_exit(mock_selector)
+
+    mock_selector.register.assert_called_once_with(7, selectors.EVENT_READ)
+    mock_selector.select.assert_called_once_with()
+    mock_selector.unregister.assert_called_once_with(7)
+
+  @patch.object(geobeam.simulations.os, 'waitid')
+  def test_wait_for_key_or_exit_without_pidfd(self, mock_waitid):
+    mock_waitid.return_value = None
+    mock_selector = Mock(spec_set=selectors.BaseSelector)
+    test_simulation = copy.copy(self.simulation_template)
+    test_simulation._process = Mock(spec_set=_PROCESS_SPEC)
+
+    test_simulation.wait_for_key_or_exit(mock_selector)
+
+    mock_selector.register.assert_not_called()
+    mock_selector.select.assert_called_once_with(0.1)
+
+  @patch.object(geobeam.simulations, 'time')
+  @patch.object(geobeam.simulations.os, 'waitid')
+  def test_wait_for_key_or_exit_without_selector(self, mock_waitid, mock_time):
+    mock_waitid.return_value = None
+    test_simulation = copy.copy(self.simulation_template)
+    test_simulation._process = Mock(spec_set=_PROCESS_SPEC)
+    test_simulation._pidfd = 7
 
-  @patch('geobeam.simulations.csv')
+    test_simulation.wait_for_key_or_exit(None)
+
+    mock_time.sleep.assert_called_once_with(0.1)
+
+  def test_wait_for_key_or_exit_not_running(self):
+    mock_selector = Mock(spec_set=selectors.BaseSelector)
+    test_simulation = copy.copy(self.simulation_template)
+
+    test_simulation.wait_for_key_or_exit(mock_selector)
+
+    mock_selector.select.assert_not_called()
+
+  @patch.object(geobeam.simulations, 'csv')
   def test_log_run(self, mock_csv):
-    mock_logfile = Mock()
-    mock_logfile.write = Mock()
-    test_simulation = geobeam.simulations.Simulation(self.run_duration, self.gain)
+    mock_logfile = Mock(spec_set=_LOG_FILE_SPEC)
+    test_simulation = copy.copy(self.simulation_template)
     test_simulation._start_time = self.start_time
     test_simulation._end_time = self.end_time
-    fields = ["simulation_type", "run_duration", "gain", "start_time", "end_time"]
-    values = ["Simulation", self.run_duration, self.gain, "2020-08-15T05:00:00", "2020-08-15T05:01:10"]
-    csv_calls = [call(fields), call(values)]
 
     test_simulation.log_run(mock_logfile)
 
     mock_logfile.write.assert_called_once_with('\n')
     mock_csv.writer.assert_called_once()
-    mock_csv.writer().writerow.assert_has_calls(csv_calls)
+    mock_csv.writer().writerow.assert_has_calls(self.log_rows)
+
+  def test_log_run_single_write(self):
+    mock_logfile = Mock(spec_set=_LOG_FILE_SPEC)
+    test_simulation = copy.copy(self.simulation_template)
+    test_simulation._start_time = self.start_time
+    test_simulation._end_time = self.end_time
+
+    test_simulation.log_run(mock_logfile)
+
+    mock_logfile.write.assert_called_once_with(
+        "\nsimulation_type,run_duration,gain,start_time,end_time\r\n"
+        "Simulation,100,-2,2020-08-15T05:00:00,2020-08-15T05:01:10\r\n")
 
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.create_bladeGPS_process')
-  def test_run_static_simulation(self, mock_create_bladeGPS_process, mock_datetime):
+  @patch.object(geobeam.simulations, '_open_pidfd')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
+  @patch.object(geobeam.simulations, 'create_bladeGPS_process')
+  def test_run_static_simulation(self, mock_create_bladeGPS_process, mock_datetime, mock_open_pidfd):
     mock_datetime.utcnow.return_value = self.start_time
-    test_simulation = geobeam.simulations.StaticSimulation(self.latitude,
-                                                           self.longitude,
-                                                           self.run_duration,
-                                                           self.gain)
+    test_simulation = copy.copy(self.static_simulation_template)
     test_simulation.run_simulation()
     self.assertEqual(test_simulation._start_time, self.start_time)
     mock_datetime.utcnow.assert_called_once()
-    mock_create_bladeGPS_process.assert_called_once_with(run_duration=self.run_duration,
-                                                         gain=self.gain,
-                                                         location=self.location)
+    mock_create_bladeGPS_process.assert_called_once_with(("./run_bladerfGPS.sh", "-T", "now",
+                                                          "-d", "100", "-a", "-2",
+                                                          "-l", self.location))
   
-  @patch('geobeam.simulations.csv')
+  @patch.object(geobeam.simulations, 'csv')
   def test_log_static_run(self, mock_csv):
-    mock_logfile = Mock()
-    mock_logfile.write = Mock()
-    test_simulation = geobeam.simulations.StaticSimulation(self.latitude,
-                                                           self.longitude,
-                                                           self.run_duration,
-                                                           self.gain)
+    mock_logfile = Mock(spec_set=_LOG_FILE_SPEC)
+    test_simulation = copy.copy(self.static_simulation_template)
     test_simulation._start_time = self.start_time
     test_simulation._end_time = self.end_time
-    fields = ["simulation_type", "latitude", "longitude", "run_duration", "gain", "start_time", "end_time"]
-    values = ["StaticSimulation", self.latitude, self.longitude, self.run_duration, self.gain, "2020-08-15T05:00:00", "2020-08-15T05:01:10"]
-    csv_calls = [call(fields), call(values)]
 
     test_simulation.log_run(mock_logfile)
 
     mock_logfile.write.assert_called_once_with('\n')
     mock_csv.writer.assert_called_once()
-    mock_csv.writer().writerow.assert_has_calls(csv_calls)
+    mock_csv.writer().writerow.assert_has_calls(self.static_log_rows)
 
-  @patch('geobeam.simulations.datetime.datetime')
-  @patch('geobeam.simulations.create_bladeGPS_process')
-  def test_run_dynamic_simulation(self, mock_create_bladeGPS_process, mock_datetime):
+  @patch.object(geobeam.simulations, '_open_pidfd')
+  @patch.object(geobeam.simulations.datetime, 'datetime')
+  @patch.object(geobeam.simulations, 'create_bladeGPS_process')
+  def test_run_dynamic_simulation(self, mock_create_bladeGPS_process, mock_datetime, mock_open_pidfd):
     mock_datetime.utcnow.return_value = self.start_time
-    test_simulation = geobeam.simulations.DynamicSimulation(self.file_path,
-                                                            self.run_duration,
-                                                            self.gain)
+    test_simulation = copy.copy(self.dynamic_simulation_template)
 
     test_simulation.run_simulation()
 
     self.assertEqual(test_simulation._start_time, self.start_time)
     mock_datetime.utcnow.assert_called_once()
-    mock_create_bladeGPS_process.assert_called_once_with(run_duration=self.run_duration,
-                                                         gain=self.gain,
-                                                         dynamic_file_path=self.file_path)
+    mock_create_bladeGPS_process.assert_called_once_with(("./run_bladerfGPS.sh", "-T", "now",
+                                                          "-d", "100", "-a", "-2",
+                                                          "-u", self.file_path))
   
-  @patch('geobeam.simulations.csv')
-  def test_log_dynamic_run(self, mock_csv):
-    mock_logfile = Mock()
-    mock_logfile.write = Mock()
-    test_simulation = geobeam.simulations.DynamicSimulation(self.file_path,
-                                                            self.run_duration,
-                                                            self.gain)
-    self.start_time = datetime(2020, 8, 15, 5, 0, 0)
-    self.end_time = datetime(2020, 8, 15, 5, 0, 10)
+  def test_log_dynamic_run(self):
+    log_file = io.StringIO()
+    test_simulation = copy.copy(self.dynamic_simulation_template)
     test_simulation._start_time = self.start_time
-    test_simulation._end_time = self.end_time
+    test_simulation._end_time = datetime(2020, 8, 15, 5, 0, 10)
+    test_simulation._start_monotonic = 1000.0
+    test_simulation._end_monotonic = 1010.0
+
+    route_lines = ["%.1f,-2694180.667,-4297222.330,3854325.576\n" % (i/10) for i in range(150)]
+
+    with tempfile.TemporaryDirectory() as directory:
+      test_simulation._file_path = os.path.join(directory, "testfile.csv")
+      with open(test_simulation._file_path, "w") as route_file:
+        route_file.writelines(route_lines)
+      test_simulation.log_run(log_file)
+
+    # 1 blank line, the csv header rows and 100 copied lines for 10 seconds of data
+    self.assertEqual(log_file.getvalue(),
+                     "\nsimulation_type,file_path,run_duration,gain,start_time,end_time\r\n"
+                     "DynamicSimulation,%s,100,-2,2020-08-15T05:00:00,2020-08-15T05:00:10\r\n"
+                     "time_from_zero,x,y,z\r\n" % test_simulation._file_path
+                     + "".join(route_lines[:100]))
+
+  def test_read_route_lines(self):
+    test_simulation = copy.copy(self.dynamic_simulation_template)
+    route_lines = ["0.0,1.0,2.0,3.0\n", "0.1,1.5,2.5,3.5\n", "0.2,2.0,3.0,4.0"]
+
+    with tempfile.TemporaryDirectory() as directory:
+      test_simulation._file_path = os.path.join(directory, "testfile.csv")
+      with open(test_simulation._file_path, "w") as route_file:
+        route_file.writelines(route_lines)
+      first_lines = test_simulation._read_route_lines(2)
+      line_ends = test_simulation._route_line_ends
+    # the file is gone, later reads come from the cached copy
+    all_lines = test_simulation._read_route_lines(10)
+
+    self.assertEqual(first_lines, "".join(route_lines[:2]))
+    self.assertEqual(all_lines, "".join(route_lines))
+    self.assertIs(test_simulation._route_line_ends, line_ends)
+    self.assertEqual(line_ends.tolist(), [15, 31])
+
+  def test_build_bladeGPS_command(self):
+    for kwargs, command in _BLADEGPS_COMMAND_CASES:
+      with self.subTest(**kwargs):
+        self.assertEqual(geobeam.simulations.build_bladeGPS_command(**kwargs), command)
+
+  @patch.object(geobeam.simulations, 'subprocess')
+  def test_create_blade_GPS_process(self, mock_subprocess):
+    command = ("./run_bladerfGPS.sh", "-T", "now", "-d", "20")
 
-    open_mock = mock_open()
-    with patch("geobeam.simulations.open", open_mock, create=True):
-      open_mock.return_value = MagicMock()
-      test_simulation.log_run(mock_logfile)
+    result = geobeam.simulations.create_bladeGPS_process(command)
 
-    mock_csv.writer.assert_called_once()
-    fields = ["simulation_type", "file_path", "run_duration", "gain", "start_time", "end_time"]
-    values = ["DynamicSimulation", self.file_path, self.run_duration, self.gain, "2020-08-15T05:00:00", "2020-08-15T05:00:10"]
-    gps_fields = ["time_from_zero", "x", "y", "z"]
-    csv_calls = [call(fields), call(values), call(gps_fields)]
-    mock_csv.writer().writerow.assert_has_calls(csv_calls)
-
-    open_mock.assert_called_with(self.file_path, "r")
-    self.assertEqual(mock_logfile.write.call_args_list[0], call('\n'))
-    # check for 1 blank line call and 100 copied lines for 10 seconds of data
-    self.assertEqual(mock_logfile.write.call_count, 101)
-
-  @patch('geobeam.simulations.subprocess')
-  def test_create_blade_GPS_process(self, mock_subprocess):
-    mock_subprocess.Popen = Mock()
-    mock_subprocess.PIPE = Mock()
-
-    commands = [["./run_bladerfGPS.sh", "-T", "now"],
-                ["./run_bladerfGPS.sh", "-T", "now", "-d", "20"],
-                ["./run_bladerfGPS.sh", "-T", "now", "-a", "-2"],
-                ["./run_bladerfGPS.sh", "-T", "now", "-u", "test/path"],
-                ["./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2"],
-                ["./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2", "-l", "27.12345,-37.45678"],
-                ["./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2", "-u", "test/path"],
-                ["./run_bladerfGPS.sh", "-T", "now", "-d", "20", "-a", "-2", "-l", "27.12345,-37.45678"]]
-
-    results = [geobeam.simulations.create_bladeGPS_process(),
-               geobeam.simulations.create_bladeGPS_process(run_duration=20),
-               geobeam.simulations.create_bladeGPS_process(gain=-2),
-               geobeam.simulations.create_bladeGPS_process(dynamic_file_path="test/path"),
-               geobeam.simulations.create_bladeGPS_process(run_duration=20, gain=-2),
-               geobeam.simulations.create_bladeGPS_process(run_duration=20, gain=-2,
-                                                           location="27.12345,-37.45678"),
-               geobeam.simulations.create_bladeGPS_process(run_duration=20, gain=-2, 
-                                                           dynamic_file_path="test/path"),
-               geobeam.simulations.create_bladeGPS_process(run_duration=20, gain=-2,
-                                                           location="27.12345,-37.45678",
-                                                           dynamic_file_path="test/path")]
-    for i in range(len(commands)):
-      self.assertEqual(mock_subprocess.Popen.call_args_list[i][0][0], commands[i])
-      self.assertEqual(results[i], mock_subprocess.Popen())
+    mock_subprocess.Popen.assert_called_once_with(command, stdin=mock_subprocess.PIPE, cwd="./bladeGPS",
+                                                  close_fds=False, start_new_session=True)
+    self.assertEqual(result, mock_subprocess.Popen())
+
+  @patch.object(geobeam.simulations.os, 'killpg')
+  def test_signal_process_group(self, mock_killpg):
+    mock_process = Mock(spec_set=_PROCESS_SPEC)
+    mock_process.pid = 1234
+    mock_killpg.side_effect = [None, ProcessLookupError]
+
+    geobeam.simulations._signal_process_group(mock_process, signal.SIGTERM)
+    geobeam.simulations._signal_process_group(mock_process, signal.SIGKILL)
+
+    mock_killpg.assert_has_calls([call(1234, signal.SIGTERM), call(1234, signal.SIGKILL)])
 
+  @patch.object(geobeam.simulations, 'select')
+  def test_wait_for_exit_already_exited(self, mock_select):
+    mock_process = Mock(spec_set=_PROCESS_SPEC)
+    mock_process.poll.return_value = 0
+
+    result = geobeam.simulations._wait_for_exit(mock_process, 7, 1)
+
+    self.assertTrue(result)
+    mock_select.select.assert_not_called()
+
+  @patch.object(geobeam.simulations.os, 'close')
+  @patch.object(geobeam.simulations, 'select')
+  def test_wait_for_exit_pidfd(self, mock_select, mock_close):
+    mock_process = Mock(spec_set=_PROCESS_SPEC)
+    mock_process.poll.side_effect = [None, 0]
+
+    result = geobeam.simulations._wait_for_exit(mock_process, 7, 1)
+
+    self.assertTrue(result)
+    mock_select.select.assert_called_once_with([7], [], [], 1)
+    mock_close.assert_not_called()
+    mock_process.wait.assert_not_called()
+
+  @patch.object(geobeam.simulations, 'select')
+  def test_wait_for_exit_pidfd_timeout(self, mock_select):
+    mock_process = Mock(spec_set=_PROCESS_SPEC)
+    mock_process.poll.return_value = None
+
+    result = geobeam.simulations._wait_for_exit(mock_process, 7, 1)
+
+    self.assertFalse(result)
+    mock_select.select.assert_called_once_with([7], [], [], 1)
+
+  def test_wait_for_exit_without_pidfd(self):
+    mock_process = Mock(spec_set=_PROCESS_SPEC)
+    mock_process.poll.return_value = None
+    mock_process.wait.side_effect = [0, subprocess.TimeoutExpired("bladeGPS", 1)]
+
+    self.assertTrue(geobeam.simulations._wait_for_exit(mock_process, None, 1))
+    self.assertFalse(geobeam.simulations._wait_for_exit(mock_process, None, 1))
+    mock_process.wait.assert_called_with(timeout=1)
+
+class EndSimulationTest(unittest.TestCase):
+
+  def setUp(self):
+    self.end_time = datetime(2020, 8, 15, 5, 1, 10)
+    self.stdout = io.StringIO()
+    redirect = contextlib.redirect_stdout(self.stdout)
+    redirect.__enter__()
+    self.addCleanup(redirect.__exit__, None, None, None)
+    self.mock_datetime = self.start_patch(geobeam.simulations.datetime, 'datetime')
+    self.mock_datetime.utcnow.return_value = self.end_time
+    self.mock_wait_for_exit = self.start_patch(geobeam.simulations, '_wait_for_exit')
+    self.mock_signal_process_group = self.start_patch(geobeam.simulations, '_signal_process_group')
+    self.mock_process = Mock(spec_set=_PROCESS_SPEC)
+    self.mock_process.stdin.closed = False
+    self.test_simulation = geobeam.simulations.Simulation(100, -2)
+    self.test_simulation._process = self.mock_process
+
+  def start_patch(self, target, attribute):
+    patcher = patch.object(target, attribute)
+    self.addCleanup(patcher.stop)
+    return patcher.start()
+
+  def end_simulation(self, **is_running):
+    with patch.object(geobeam.simulations.Simulation, "is_running", **is_running):
+      self.test_simulation.end_simulation()
+    self.assertIsNone(self.test_simulation._process)
+    self.assertEqual(self.test_simulation._end_time, self.end_time)
+
+  @patch.object(geobeam.simulations.os, 'close')
+  def test_end_simulation_running(self, mock_close):
+    # error writing the quit key, results of each wait for exit, and the
+    # signals sent before the process exited
+    cases = [(None, [True], []),
+             (None, [False, True], [signal.SIGTERM]),
+             (None, [False, False, True], [signal.SIGTERM, signal.SIGKILL]),
+             (BrokenPipeError, [False, True], [signal.SIGTERM])]
+    wait_timeouts = [1, 1, None]
+    for write_error, wait_results, signals in cases:
+      with self.subTest(write_error=write_error, signals=signals):
+        self.mock_process.reset_mock()
+        self.mock_wait_for_exit.reset_mock()
+        self.mock_signal_process_group.reset_mock()
+        mock_close.reset_mock()
+        self.mock_process.stdin.write.side_effect = write_error
+        self.mock_wait_for_exit.side_effect = wait_results
+        self.test_simulation._process = self.mock_process
+        self.test_simulation._pidfd = 7
+
+        self.end_simulation(side_effect=[True, False])
+
+        self.mock_process.stdin.write.assert_called_once_with(b"q")
+        self.assertEqual(self.mock_process.stdin.flush.called, write_error is None)
+        self.mock_process.stdin.close.assert_called_once_with()
+        self.assertEqual(self.mock_signal_process_group.call_args_list,
+                         [call(self.mock_process, signal_number) for signal_number in signals])
+        self.assertEqual(self.mock_wait_for_exit.call_args_list,
+                         [call(self.mock_process, 7, timeout)
+                          for timeout in wait_timeouts[:len(wait_results)]])
+        mock_close.assert_called_once_with(7)
+
+  @patch.object(geobeam.simulations.os, 'close')
+  def test_end_simulation_closes_pidfd(self, mock_close):
+    self.test_simulation._pidfd = 7
+
+    self.end_simulation(return_value=False)
+
+    mock_close.assert_called_once_with(7)
+    self.assertIsNone(self.test_simulation._pidfd)
+
+  def test_end_simulation_interrupted(self):
+    read_fd, write_fd = os.pipe()
+    self.addCleanup(os.close, read_fd)
+    self.mock_process.stdin = open(write_fd, "wb")
+    self.mock_wait_for_exit.side_effect = [KeyboardInterrupt, False, True]
+
+    with self.assertRaises(KeyboardInterrupt):
+      self.end_simulation(return_value=True)
+    self.end_simulation(return_value=True)
+
+    self.assertEqual(os.read(read_fd, 16), b"q")
+    self.assertEqual(self.mock_signal_process_group.call_args_list,
+                     [call(self.mock_process, signal.SIGTERM)])
+
+  def test_end_simulation_without_process(self):
+    self.test_simulation._process = None
+
+    self.end_simulation(return_value=False)
+
+    self.mock_wait_for_exit.assert_not_called()
+    self.mock_signal_process_group.assert_not_called()
+
+  def test_end_simulation_twice(self):
+    self.end_simulation(return_value=False)
+    self.end_simulation(return_value=False)
+
+    self.mock_process.stdin.close.assert_called_once_with()
+    self.mock_wait_for_exit.assert_not_called()
+
+  def test_end_simulation_done_running(self):
+    self.end_simulation(return_value=False)
+
+    self.mock_process.stdin.write.assert_not_called()
+    self.mock_process.stdin.close.assert_called_once_with()
+    self.mock_signal_process_group.assert_not_called()
+    self.mock_process.poll.assert_not_called()
+    self.mock_wait_for_exit.assert_not_called()